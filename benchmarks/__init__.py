@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the utils package, run with asv (airspeed velocity).
+
+The results are stored in benchmarks/results, one file per commit and machine, so
+that they can be compared across commits.
+
+Usage :
+    asv run                         benchmarks the last commit of master
+    asv continuous master HEAD      compares HEAD to master, failing on regressions
+    asv compare <commit> <commit>   compares two commits already benchmarked
+    asv run --python=same --quick   quick check in the current environment
+
+The standalone script config_backends.py can also be run directly with python. The
+import-time budgets are checked by the test suite, in tests/test_import_budget.py.
+
+"""
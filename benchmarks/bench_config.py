@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of Config.create, load and save, for ConfigToml and ConfigDatabase.
+
+"""
+
+import pathlib
+import tempfile
+
+from utils.config import Config
+
+from .config_backends import create_config_file, create_parameters
+
+
+class ConfigSuite:
+
+    """Times the creation, loading and saving of configs of growing size."""
+
+    params = ([".toml", ".ini"], [10 ** 2, 10 ** 4, 10 ** 5])
+    param_names = ["backend", "parameters"]
+    timeout = 600
+
+    def setup(self, backend: str, number_of_parameters: int) -> None:
+        # pylint: disable=attribute-defined-outside-init, consider-using-with
+        self.folder = tempfile.TemporaryDirectory()
+        self.config_file = create_config_file(pathlib.Path(self.folder.name), backend)
+        self.config = Config.create(
+            self.config_file, create_parameters(number_of_parameters), shared=False
+        )
+        self.config.save()  # type: ignore
+
+    def teardown(self, backend: str, number_of_parameters: int) -> None:
+        # pylint: disable=unused-argument
+        Config.create(self.config_file).release()
+        del self.config
+        self.folder.cleanup()
+
+    def time_create(self, backend: str, number_of_parameters: int) -> None:
+        # pylint: disable=missing-function-docstring, unused-argument
+        Config.create(self.config_file, shared=False)
+
+    def time_create_shared(self, backend: str, number_of_parameters: int) -> None:
+        # pylint: disable=missing-function-docstring, unused-argument
+        Config.create(self.config_file)
+
+    def time_load(self, backend: str, number_of_parameters: int) -> None:
+        # pylint: disable=missing-function-docstring, unused-argument
+        self.config.load()  # type: ignore
+
+    def time_save(self, backend: str, number_of_parameters: int) -> None:
+        # pylint: disable=missing-function-docstring, unused-argument
+        # Saving an unchanged config does nothing : a value is changed before each save.
+        self.config["int_0"] += 1
+        self.config.save()  # type: ignore
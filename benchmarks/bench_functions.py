@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of get_data_folder and get_package_folder, called from different depths
+of the call stack.
+
+"""
+
+from typing import Any, Callable
+
+from utils.config import Config
+from utils.functions import get_data_folder, get_package_folder
+
+
+def _call_at_depth(depth: int, function: Callable[..., Any], *args: Any) -> Any:
+    if depth > 1:
+        return _call_at_depth(depth - 1, function, *args)
+    return function(*args)
+
+
+class FunctionsSuite:
+
+    """
+    Times the package and data folder resolution.
+
+    Without argument, the caller is found by inspecting the whole stack, the cost
+    therefore depends on the depth of the call.
+    """
+
+    params = [1, 10, 100]
+    param_names = ["depth"]
+
+    def time_get_package_folder(self, depth: int) -> None:
+        # pylint: disable=missing-function-docstring
+        _call_at_depth(depth, get_package_folder)
+
+    def time_get_package_folder_from_object(self, depth: int) -> None:
+        # pylint: disable=missing-function-docstring
+        _call_at_depth(depth, get_package_folder, Config)
+
+    def time_get_data_folder(self, depth: int) -> None:
+        # pylint: disable=missing-function-docstring
+        _call_at_depth(depth, get_data_folder)
+
+    def time_get_data_folder_from_object(self, depth: int) -> None:
+        # pylint: disable=missing-function-docstring
+        _call_at_depth(depth, get_data_folder, Config)
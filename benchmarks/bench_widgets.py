@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the widgets creation, under the offscreen Qt platform.
+
+"""
+
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+# pylint: disable=wrong-import-position
+from PySide6 import QtWidgets
+
+from utils.my_custom_widget import MyMsgBox
+
+
+class WidgetsSuite:
+
+    """Times the creation of widgets from .ui files."""
+
+    def setup(self) -> None:
+        # pylint: disable=attribute-defined-outside-init
+        self.application = (
+            QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+        )
+
+    def time_create_widget(self) -> None:
+        # pylint: disable=missing-function-docstring
+        MyMsgBox.create_widget()
+
+    def time_create_msg_box(self) -> None:
+        # pylint: disable=missing-function-docstring
+        MyMsgBox.create_msg_box()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compares the load and save times of the Config backends.
+
+The same parameters (ints, strings and paths) are saved and loaded with each backend,
+the best time of several runs being reported.
+
+Usage : python benchmarks/config_backends.py [--parameters N] [--repeat N]
+
+"""
+
+import argparse
+import marshal
+import pathlib
+import sqlite3
+import sys
+import tempfile
+import timeit
+from typing import Callable
+
+ROOT_FOLDER = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_FOLDER))
+
+# pylint: disable=wrong-import-position
+from utils.config import Config, Parameters
+
+PARAMETER_TABLE_SQL = """
+CREATE TABLE parameter (
+    name VARCHAR(255) PRIMARY KEY,
+    value VARCHAR(255),
+    description VARCHAR(255),
+    "group" VARCHAR(255)
+)
+"""
+"""
+The table used by ConfigDatabase. Like in existing databases, only the name is
+mandatory, ConfigDatabase.save not filling the description and group.
+"""
+
+
+def create_parameters(number: int) -> Parameters:
+    """Creates number parameters, equally split between ints, strings and paths."""
+    parameters: Parameters = {}
+    for index in range(number):
+        if index % 3 == 0:
+            parameters[f"int_{index}"] = index
+        elif index % 3 == 1:
+            parameters[f"str_{index}"] = f"value {index}"
+        else:
+            parameters[f"path_{index}"] = pathlib.Path(f"folder/file_{index}.txt")
+    return parameters
+
+
+def create_config_file(folder: pathlib.Path, suffix: str) -> pathlib.Path:
+    """Creates an empty config file for the backend associated with suffix."""
+    config_file = folder / f"config{suffix}"
+    if suffix in (".ini", ".txt"):
+        database_file = folder / "config.sqlite"
+        config_file.write_text(str(database_file))
+        with sqlite3.connect(database_file) as connection:
+            connection.execute(PARAMETER_TABLE_SQL)
+        connection.close()
+    elif suffix == ".json":
+        config_file.write_text("{}")
+    elif suffix == ".marshal":
+        config_file.write_bytes(marshal.dumps({}))
+    else:
+        config_file.write_text("")
+    return config_file
+
+
+def best_time(function: Callable[[], None], repeat: int) -> float:
+    """The best time of repeat runs of function, in ms."""
+    return min(timeit.repeat(function, number=1, repeat=repeat)) * 1000
+
+
+def benchmark_backend(suffix: str, parameters: Parameters, repeat: int) -> None:
+    """Prints the save and load times for the backend associated with suffix."""
+    with tempfile.TemporaryDirectory() as folder:
+        config_file = create_config_file(pathlib.Path(folder), suffix)
+        config = Config.create(config_file, parameters, shared=False)
+        config.save()  # type: ignore
+
+        def change_and_save() -> None:
+            # Saving an unchanged config does nothing for some backends.
+            config["int_0"] += 1
+            config.save()  # type: ignore
+
+        save_time = best_time(change_and_save, repeat)
+        load_time = best_time(lambda: Config.create(config_file, shared=False), repeat)
+        loaded_config = Config.create(config_file, shared=False)
+        assert loaded_config.data == config.data
+        del config, loaded_config
+    print(f"{suffix:<10} {save_time:10.1f} ms {load_time:10.1f} ms")
+
+
+def main() -> None:
+    """Benchmarks all registered backends."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--parameters", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    arguments = parser.parse_args()
+    parameters = create_parameters(arguments.parameters)
+    print(f"{arguments.parameters} parameters")
+    print(f"{'backend':<10} {'save':>13} {'load':>13}")
+    # pylint: disable=protected-access
+    for suffix in Config._backends:
+        if suffix != ".txt":
+            benchmark_backend(suffix, parameters, arguments.repeat)
+
+
+if __name__ == "__main__":
+    main()
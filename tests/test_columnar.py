@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the columnar file format.
+
+"""
+
+import datetime
+import pathlib
+from typing import Any, List
+
+import pytest
+
+from utils.columnar import ColumnarTable, ColumnarWriter, write_table
+
+HEADERS = ["Id", "Country", "Mixed"]
+
+ROWS: List[Any] = [
+    {"Id": 1, "Country": "France", "Mixed": 1},
+    {"Id": None, "Country": "Spain", "Mixed": None},
+    {"Id": 3, "Country": None, "Mixed": "1"},
+    {"Id": 4, "Country": "France", "Mixed": 2.5},
+    {"Id": 5, "Country": "Italy", "Mixed": True},
+]
+
+
+@pytest.fixture(name="table_file")
+def fixture_table_file(tmp_path: pathlib.Path) -> pathlib.Path:
+    """A table written from ROWS, in two batches."""
+    table_file = tmp_path / "table.columnar"
+    write_table(table_file, HEADERS, [ROWS[:2], ROWS[2:]])
+    return table_file
+
+
+def test_rows_are_read_back(table_file: pathlib.Path) -> None:
+    with ColumnarTable(table_file) as table:
+        assert len(table) == len(ROWS)
+        assert table.headers == HEADERS
+        rows = list(table.rows())
+    assert rows == ROWS
+    assert [type(row["Mixed"]) for row in rows] == [int, type(None), str, float, bool]
+
+
+def test_column_kinds(table_file: pathlib.Path) -> None:
+    with ColumnarTable(table_file) as table:
+        assert table.column("Id").kind == "int"
+        assert table.column("Country").kind == "str"
+        assert table.column("Mixed").kind == "mixed"
+        assert table.column("Id").is_null(1)
+        assert list(table.column("Id")) == [row["Id"] for row in ROWS]
+
+
+def test_floats_convert_int_columns(tmp_path: pathlib.Path) -> None:
+    table_file = tmp_path / "table.columnar"
+    rows: List[Any] = [{"Value": 1}, {}, {"Value": 2.5}]
+    write_table(table_file, ["Value"], [rows[:2], rows[2:]])
+    with ColumnarTable(table_file) as table:
+        assert list(table.column("Value")) == [1, None, 2.5]
+
+
+def test_unsupported_values_are_rejected(tmp_path: pathlib.Path) -> None:
+    with pytest.raises(TypeError):
+        with ColumnarWriter(tmp_path / "table.columnar", ["Date"]) as writer:
+            rows: List[Any] = [{"Date": datetime.date(2020, 1, 1)}]
+            writer.write_batch(rows)
+
+
+def test_filter(table_file: pathlib.Path) -> None:
+    with ColumnarTable(table_file) as table:
+        assert table.filter([("Country", ["France", None])]) == [0, 2, 3]
+        assert table.filter([("Country", ["France"]), ("Id", [4])]) == [3]
+        assert table.filter([("Mixed", ["1"])]) == [2]
+        assert table.filter([("Id", [None, 5])]) == [1, 4]
+        assert table.filter([]) == list(range(len(ROWS)))
+        indices = table.filter([("Country", ["France"])])
+        assert list(table.rows(indices, ["Id"])) == [{"Id": 1}, {"Id": 4}]
+
+
+def test_empty_table(tmp_path: pathlib.Path) -> None:
+    table_file = tmp_path / "table.columnar"
+    write_table(table_file, HEADERS, [])
+    with ColumnarTable(table_file) as table:
+        assert len(table) == 0
+        assert list(table.rows()) == []
+        assert table.filter([("Country", ["France"])]) == []
+
+
+def test_close_after_views_were_taken(table_file: pathlib.Path) -> None:
+    table = ColumnarTable(table_file)
+    column = table.column("Country")
+    assert column.get_dictionary() == ["France", "Spain", "Italy"]
+    table.close()
+    with pytest.raises(ValueError):
+        column.values[0]  # pylint: disable=pointless-statement
+
+
+def test_not_a_table_file(tmp_path: pathlib.Path) -> None:
+    table_file = tmp_path / "table.columnar"
+    table_file.write_bytes(b"0" * 32)
+    with pytest.raises(ValueError):
+        ColumnarTable(table_file)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of ConfigDatabase, and of its connection pool shared between threads.
+
+"""
+
+import pathlib
+import sqlite3
+import threading
+from typing import List
+
+import pytest
+
+from utils.config import Config
+
+pytest.importorskip("peewee")
+
+PARAMETER_TABLE_SQL = """
+CREATE TABLE parameter (
+    name VARCHAR(255) PRIMARY KEY,
+    value VARCHAR(255),
+    description VARCHAR(255),
+    "group" VARCHAR(255)
+)
+"""
+
+
+@pytest.fixture(name="config_file")
+def fixture_config_file(tmp_path: pathlib.Path) -> pathlib.Path:
+    """An .ini file pointing to an empty parameter database."""
+    database_file = tmp_path / "config.sqlite"
+    with sqlite3.connect(database_file) as connection:
+        connection.execute(PARAMETER_TABLE_SQL)
+    connection.close()
+    config_file = tmp_path / "config.ini"
+    config_file.write_text(str(database_file))
+    return config_file
+
+
+def test_save_and_load(config_file: pathlib.Path) -> None:
+    config = Config.create(config_file, shared=False)
+    config["number"] = 1
+    config["path"] = pathlib.Path("folder/file.txt")
+    config.save()  # type: ignore
+    loaded_config = Config.create(config_file, shared=False)
+    assert loaded_config.data == config.data
+
+
+def test_connections_are_shared_between_threads(config_file: pathlib.Path) -> None:
+    config = Config.create(config_file, shared=False)
+    config["number"] = 1
+    config.load()  # type: ignore
+    config.save()  # type: ignore
+    exceptions: List[BaseException] = []
+
+    def load_and_save() -> None:
+        try:
+            config.load()  # type: ignore
+            config["number"] = 2
+            config.save()  # type: ignore
+        except Exception as exception:  # pylint: disable=broad-except
+            exceptions.append(exception)
+
+    thread = threading.Thread(target=load_and_save)
+    thread.start()
+    thread.join()
+    assert not exceptions
+    config.aload().result()
+    config.asave().result()
+    assert Config.create(config_file, shared=False)["number"] == 2
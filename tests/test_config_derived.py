@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the derived parameters of Config.
+
+"""
+
+import json
+import pathlib
+from typing import List
+
+from utils.config import Config
+
+
+def test_only_affected_values_are_computed_again(tmp_path: pathlib.Path) -> None:
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps({"size": 3, "other": 1}))
+    config = Config.create(config_file, shared=False)
+    calls: List[str] = []
+
+    def compute_area(size: int) -> int:
+        calls.append("area")
+        return size * size
+
+    config.register_derived("area", ["size"], compute_area)
+    config.register_derived("half_area", ["area"], lambda area: area / 2)
+    assert config["half_area"] == 4.5
+    assert config["area"] == 9
+    assert calls == ["area"]
+    config["other"] = 2
+    config.reload()
+    assert config["area"] == 9
+    assert calls == ["area"]
+    config["size"] = 4
+    assert config["half_area"] == 8
+    config.reload()
+    assert config["half_area"] == 4.5
+    assert calls == ["area", "area", "area"]
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the autosave mode of Config.
+
+"""
+
+import json
+import pathlib
+import time
+
+import pytest
+
+from utils.config import Config
+from utils.config_journal import ConfigJournal
+
+
+@pytest.fixture(name="config_file")
+def fixture_config_file(tmp_path: pathlib.Path) -> pathlib.Path:
+    """An empty json config file."""
+    config_file = tmp_path / "config.json"
+    config_file.write_text("{}")
+    return config_file
+
+
+def test_journal_left_by_a_crash_is_replayed(config_file: pathlib.Path) -> None:
+    journal_path = ConfigJournal.get_journal_path(config_file)
+    journal_path.write_text('["a", 1]\n["b", 2]\n["c", ')
+    config = Config.create(config_file, shared=False)
+    assert config.data == {"a": 1, "b": 2}
+    assert not journal_path.exists()
+
+
+def test_journal_of_a_live_config_is_not_replayed(config_file: pathlib.Path) -> None:
+    config = Config.create(config_file, shared=False)
+    config.enable_autosave(quiet_period=60)
+    config["a"] = 2
+    journal_path = ConfigJournal.get_journal_path(config_file)
+    other_config = Config.create(config_file, {"option": 1}, shared=False)
+    assert "a" not in other_config.data
+    assert journal_path.exists()
+    with pytest.raises(ValueError):
+        other_config.enable_autosave()
+    config.disable_autosave()
+    assert not journal_path.exists()
+    assert Config.create(config_file, shared=False)["a"] == 2
+
+
+def test_failed_save_is_retried(
+    config_file: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    config = Config.create(config_file, shared=False)
+    config.enable_autosave(quiet_period=0.05)
+    original_save = config.save  # type: ignore
+
+    def failing_save() -> None:
+        monkeypatch.undo()
+        raise OSError("The disk is full")
+
+    monkeypatch.setattr(config, "save", failing_save)
+    config["a"] = 1
+    deadline = time.monotonic() + 5
+    while "a" not in json.loads(config_file.read_text()):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert config.save == original_save  # type: ignore
+    config["b"] = 2
+    config.disable_autosave()
+    assert json.loads(config_file.read_text()) == {"a": 1, "b": 2}
+
+
+def test_failed_save_keeps_the_journal(
+    config_file: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    config = Config.create(config_file, shared=False)
+    config.enable_autosave(quiet_period=60)
+    config["a"] = 1
+
+    def failing_save() -> None:
+        raise OSError("The disk is full")
+
+    monkeypatch.setattr(config, "save", failing_save)
+    with pytest.raises(OSError):
+        config.disable_autosave()
+    assert json.loads(config_file.read_text()) == {}
+    assert Config.create(config_file, shared=False)["a"] == 1
+
+
+def test_save_replaces_the_file(config_file: pathlib.Path) -> None:
+    config = Config.create(config_file, shared=False)
+    config["a"] = 1
+    config.save()  # type: ignore
+    assert [path.name for path in config_file.parent.iterdir()] == [config_file.name]
+    assert json.loads(config_file.read_text()) == {"a": 1}
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the config objects shared per backing file and options.
+
+"""
+
+import pathlib
+import threading
+from typing import Iterator, List
+
+import pytest
+
+from utils.config import Config
+from utils.config_json import ConfigJson
+
+
+class BlockingConfig(ConfigJson):
+    """A json config whose loading waits until it is allowed to finish."""
+
+    can_load = threading.Event()
+    started_loading = threading.Event()
+
+    def load(self) -> None:
+        BlockingConfig.started_loading.set()
+        assert BlockingConfig.can_load.wait(5)
+        super().load()
+
+
+@pytest.fixture(name="blocking_config_file")
+def fixture_blocking_config_file(tmp_path: pathlib.Path) -> Iterator[pathlib.Path]:
+    """A config file read by BlockingConfig."""
+    Config.register_backend(".blocking", f"{__name__}.BlockingConfig")
+    BlockingConfig.can_load.clear()
+    BlockingConfig.started_loading.clear()
+    config_file = tmp_path / "config.blocking"
+    config_file.write_text('{"a": 1}')
+    yield config_file
+    BlockingConfig.can_load.set()
+    del Config._backends[".blocking"]  # pylint: disable=protected-access
+
+
+def test_configs_are_shared(tmp_path: pathlib.Path) -> None:
+    config_file = tmp_path / "config.json"
+    config_file.write_text('{"a": 1}')
+    config = Config.create(config_file)
+    assert Config.create(tmp_path / "." / "config.json") is config
+    assert Config.create(config_file, {"a": 2}) is not config
+    assert Config.create(config_file, shared=False) is not config
+    config.release()
+    assert Config.create(config_file) is not config
+
+
+def test_slow_creation_does_not_block_other_files(
+    tmp_path: pathlib.Path, blocking_config_file: pathlib.Path
+) -> None:
+    configs: List[Config] = []
+
+    def create_config() -> None:
+        configs.append(Config.create(blocking_config_file))
+
+    threads = [threading.Thread(target=create_config) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    assert BlockingConfig.started_loading.wait(5)
+    other_file = tmp_path / "other.json"
+    other_file.write_text('{"b": 2}')
+    assert Config.create(other_file)["b"] == 2
+    BlockingConfig.can_load.set()
+    for thread in threads:
+        thread.join()
+    assert configs[0] is configs[1]
+    assert configs[0]["a"] == 1
+    configs[0].release()
+
+
+def test_acreate_takes_the_options_of_create(tmp_path: pathlib.Path) -> None:
+    config_file = tmp_path / "config.json"
+    config_file.write_text('{"path": "PathObject:folder"}')
+    shared_config = Config.acreate(config_file).result()
+    config = Config.acreate(config_file, shared=False, compact=True).result()
+    assert config is not shared_config
+    assert config.compact
+    assert config["path"] == pathlib.Path("folder")
+    shared_config.release()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of ConfigToml, and regression tests of its writer, which only rewrites the
+modified lines.
+
+"""
+
+import pathlib
+import textwrap
+
+import pytest
+
+from utils.config import Config
+
+pytest.importorskip("toml")
+
+
+def create_config(folder: pathlib.Path, content: str) -> Config:
+    """Writes content to a toml file, and creates a config not shared from it."""
+    config_file = folder / "config.toml"
+    config_file.write_text(textwrap.dedent(content).lstrip())
+    return Config.create(config_file, shared=False)
+
+
+def save_and_reload(config: Config) -> Config:
+    """Saves config, and creates a new config from the same file."""
+    config.save()  # type: ignore
+    reloaded_config = Config.create(config.config_file, shared=False)
+    assert reloaded_config.data == config.data
+    return reloaded_config
+
+
+def test_unchanged_file_is_not_rewritten(tmp_path: pathlib.Path) -> None:
+    content = """
+        # comment
+        name = "x"  # trailing comment
+        point = {x = 1, y = 2}
+    """
+    config = create_config(tmp_path, content)
+    config.save()  # type: ignore
+    assert config.config_file.read_text() == textwrap.dedent(content).lstrip()
+
+
+def test_dotted_keys(tmp_path: pathlib.Path) -> None:
+    config = create_config(
+        tmp_path,
+        """
+        db.host = "h"
+        "quoted.part".size = 1
+
+        [pool]
+        max.size = 5
+        """,
+    )
+    assert config["db.host"] == "h"
+    assert config["quoted.part.size"] == 1
+    config["db.host"] = "other"
+    config["pool.max.size"] = 6
+    save_and_reload(config)
+    content = config.config_file.read_text()
+    assert 'db.host = "other"' in content
+    assert "max.size = 6" in content
+
+
+def test_inline_tables(tmp_path: pathlib.Path) -> None:
+    config = create_config(
+        tmp_path,
+        """
+        point = {x = 1, y = 2}
+        name = "x"
+        """,
+    )
+    assert config["point.x"] == 1
+    config["name"] = "y"
+    reloaded_config = save_and_reload(config)
+    assert "point = {x = 1, y = 2}" in config.config_file.read_text()
+    reloaded_config["point.x"] = 3
+    reloaded_config["point.z"] = 4
+    save_and_reload(reloaded_config)
+    content = config.config_file.read_text()
+    assert "point = {x = 3, y = 2, z = 4}" in content
+    assert "point.x" not in content
+
+
+def test_arrays_of_inline_tables(tmp_path: pathlib.Path) -> None:
+    config = create_config(tmp_path, "points = [{a = 1}]\n")
+    config["points"] = [{"a": 2}, {"b": "s"}]
+    save_and_reload(config)
+    assert 'points = [{a = 2}, {b = "s"}]' in config.config_file.read_text()
+
+
+def test_arrays_of_tables(tmp_path: pathlib.Path) -> None:
+    config = create_config(
+        tmp_path,
+        """
+        [[fruits]]
+        name = "apple"
+
+        [fruits.physical]
+        color = "red"
+
+        [other]
+        key = 1
+
+        [[fruits]]
+        name = "banana"
+        """,
+    )
+    config["fruits"] = config["fruits"] + [{"name": "kiwi"}]
+    reloaded_config = save_and_reload(config)
+    assert reloaded_config["fruits"][0]["physical"] == {"color": "red"}
+    assert reloaded_config["other.key"] == 1
+    reloaded_config["fruits"] = {"name": "apple"}
+    with pytest.raises(ValueError):
+        reloaded_config.save()  # type: ignore
+
+
+def test_multi_line_arrays(tmp_path: pathlib.Path) -> None:
+    config = create_config(
+        tmp_path,
+        """
+        values = [
+            1,
+            2,
+        ]
+        other = "x"
+        """,
+    )
+    config["other"] = "y"
+    save_and_reload(config)
+    assert "    2,\n]" in config.config_file.read_text()
+    config["values"] = [1, 2, 3]
+    reloaded_config = save_and_reload(config)
+    assert reloaded_config["values"] == [1, 2, 3]
+    assert reloaded_config["other"] == "y"
+
+
+def test_new_keys_inside_existing_tables(tmp_path: pathlib.Path) -> None:
+    config = create_config(
+        tmp_path,
+        """
+        name = "x"
+
+        [db]
+        host = "h"
+
+        [db.pool]
+        size = 5
+
+        [other]
+        key = 1
+        """,
+    )
+    config["db.port"] = 80
+    config["db.pool.timeout"] = 10
+    config["root_key"] = True
+    save_and_reload(config)
+    lines = config.config_file.read_text().splitlines()
+    assert lines.index("port = 80") == lines.index('host = "h"') + 1
+    assert lines.index("timeout = 10") == lines.index("size = 5") + 1
+    assert lines.index("root_key = true") < lines.index("[db]")
+
+
+def test_lazy_shards_are_not_journaled(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "db.toml").write_text("new = 1\n\n[pool]\nsize = 6\n")
+    config_file = tmp_path / "config.toml"
+    config_file.write_text('name = "x"\n\n[__include__]\ndb = "db.toml"\n')
+    config = Config.create(config_file, shared=False, lazy=True)
+    assert "db.pool.size" not in config.data
+    config.enable_autosave(quiet_period=60)
+    assert config["db.pool.size"] == 6
+    journal_path = config_file.with_name("config.toml.journal")
+    assert journal_path.read_bytes() == b""
+    config["db.new"] = 2
+    config.disable_autosave()
+    assert Config.create(config_file, shared=False)["db.new"] == 2
+
+
+def test_quoted_keys_of_inline_tables(tmp_path: pathlib.Path) -> None:
+    config = create_config(tmp_path, 'pt = {"x.y" = 1, z = 2}\n')
+    config["pt.z"] = 3
+    config["pt.w.v"] = 4
+    save_and_reload(config)
+    content = config.config_file.read_text()
+    assert content == 'pt = {"x.y" = 1, z = 3, w = {v = 4}}\n'
+
+
+def test_colliding_keys_are_rejected(tmp_path: pathlib.Path) -> None:
+    with pytest.raises(ValueError):
+        create_config(tmp_path, '"a.b" = 1\na.b = 2\n')
+    config = create_config(tmp_path, "pt = {x = 1, y = 2}\n")
+    config["pt.x.z"] = 3
+    with pytest.raises(ValueError):
+        config.save()  # type: ignore
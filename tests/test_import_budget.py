@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+"""
+Checks that importing the utils modules stays within a time budget.
+
+Each module is imported in a fresh interpreter with "python -X importtime", and the
+best cumulative import time reported for it over a few runs is compared to its
+budget. Modules whose dependencies are not installed are skipped.
+
+"""
+
+import pathlib
+import re
+import subprocess
+import sys
+from typing import Dict, Optional
+
+import pytest
+
+ROOT_FOLDER = pathlib.Path(__file__).resolve().parent.parent
+
+REPEAT = 3
+"""The number of measures per module, the best one being kept."""
+
+BUDGETS_IN_MS: Dict[str, float] = {
+    "utils": 10,
+    "utils.my_types": 30,
+    "utils.instrumentation": 30,
+    "utils.diagnostics": 30,
+    "utils.config": 40,
+    "utils.config_journal": 40,
+    "utils.config_json": 40,
+    "utils.config_marshal": 40,
+    "utils.columnar": 50,
+    "utils.functions": 60,
+    "utils.out_of_core": 60,
+    "utils.config_toml": 80,
+    "utils.config_database": 200,
+    "utils.thumbnails": 250,
+    "utils.stall_detector": 300,
+    "utils.my_custom_widget": 400,
+}
+"""
+The maximum cumulative import time of each module, in milliseconds.
+
+The budget of "utils" guarantees that the package itself imports none of the heavy
+dependencies (PySide6, Pillow, peewee) before they are actually needed, and the
+budget of "utils.config" that the modules it imports on every import (instrumentation
+and diagnostics) stay light.
+"""
+
+_IMPORT_TIME_LINE = re.compile(r"import time:\s+\d+\s+\|\s+(\d+)\s+\|\s+(\S+)")
+
+
+def measure_import_time(module_name: str) -> Optional[float]:
+    """
+    The cumulative time to import module_name in a fresh interpreter, in ms, or None
+    if one of its dependencies is not installed.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+        cwd=ROOT_FOLDER,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if process.returncode != 0:
+        if "ModuleNotFoundError" in process.stderr:
+            return None
+        raise RuntimeError(f"Could not import {module_name} :\n{process.stderr}")
+    for line in process.stderr.splitlines():
+        match = _IMPORT_TIME_LINE.match(line)
+        if match is not None and match.group(2) == module_name:
+            return int(match.group(1)) / 1000
+    raise ValueError(f"No import time reported for {module_name}")
+
+
+@pytest.mark.parametrize("module_name", list(BUDGETS_IN_MS))
+def test_import_time_is_within_budget(module_name: str) -> None:
+    import_times = [measure_import_time(module_name) for _ in range(REPEAT)]
+    if None in import_times:
+        pytest.skip(f"A dependency of {module_name} is not installed")
+    import_time = min(time for time in import_times if time is not None)
+    budget = BUDGETS_IN_MS[module_name]
+    assert import_time <= budget, (
+        f"Importing {module_name} takes {import_time:.1f} ms, over its budget of "
+        f"{budget:.1f} ms"
+    )
+
+
+def test_all_modules_have_a_budget() -> None:
+    module_names = {
+        f"utils.{path.stem}"
+        for path in (ROOT_FOLDER / "utils").glob("*.py")
+        if path.stem != "__init__"
+    }
+    assert module_names <= set(BUDGETS_IN_MS)
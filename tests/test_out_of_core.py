@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the out-of-core sort and group-by of DataRow tables.
+
+"""
+
+import pathlib
+from typing import List
+
+import pytest
+
+from utils import out_of_core
+from utils.my_types import DataRow
+
+
+def create_rows(count: int, values: int) -> List[DataRow]:
+    """Rows with a unique index, and a key with values distinct values, one is None."""
+    return [
+        {"index": index, "key": None if index % values == 0 else str(index % values)}
+        for index in range(count)
+    ]
+
+
+def get_size(rows: List[DataRow]) -> int:
+    """The size of the rows, as estimated against the memory budget."""
+    # pylint: disable=protected-access
+    return sum(out_of_core._get_row_size(row) for row in rows)
+
+
+def test_sort_in_memory() -> None:
+    rows = create_rows(50, 7)
+    batches = list(out_of_core.sort_rows(rows, "index", reverse=True, batch_size=20))
+    assert [len(batch) for batch in batches] == [20, 20, 10]
+    assert [row["index"] for batch in batches for row in batch] == list(
+        reversed(range(50))
+    )
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+def test_sort_with_several_runs(tmp_path: pathlib.Path, reverse: bool) -> None:
+    rows = create_rows(500, 13)
+    batches = out_of_core.sort_rows(
+        iter(rows),
+        "key",
+        reverse=reverse,
+        memory_budget=get_size(rows[:60]),
+        max_workers=2,
+        temporary_folder=tmp_path,
+    )
+    sorted_rows = [row for batch in batches for row in batch]
+    expected_keys = sorted(
+        (row["key"] for row in rows),
+        key=lambda key: (0, "") if key is None else (2, key),
+        reverse=reverse,
+    )
+    assert [row["key"] for row in sorted_rows] == expected_keys
+    assert len(sorted_rows) == 500
+    assert {row["index"] for row in sorted_rows} == set(range(500))
+
+
+def test_group_preserves_all_rows(tmp_path: pathlib.Path) -> None:
+    rows = create_rows(300, 30)
+    groups = dict(
+        out_of_core.group_rows(
+            iter(rows),
+            "key",
+            partitions=4,
+            memory_budget=get_size(rows[:40]),
+            temporary_folder=tmp_path,
+        )
+    )
+    assert len(groups) == 30
+    for key, group in groups.items():
+        assert group == [row for row in rows if row["key"] == key]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_skewed_partitions_are_split_again(tmp_path: pathlib.Path) -> None:
+    # Most rows hold None, which fills a partition beyond the memory budget.
+    rows = create_rows(400, 200) + [{"index": -1, "key": None}] * 23
+    groups = dict(
+        out_of_core.group_rows(
+            rows,
+            "key",
+            partitions=4,
+            memory_budget=get_size(rows[:40]),
+            temporary_folder=tmp_path,
+        )
+    )
+    assert sum(len(group) for group in groups.values()) == len(rows)
+    assert len(groups[None]) == 25
+
+
+def test_single_value_larger_than_the_budget(tmp_path: pathlib.Path) -> None:
+    rows = create_rows(100, 50) + [{"index": -1, "key": None}] * 100
+    with pytest.raises(ValueError):
+        list(
+            out_of_core.group_rows(
+                rows,
+                "key",
+                partitions=4,
+                memory_budget=get_size(rows[:50]),
+                temporary_folder=tmp_path,
+            )
+        )
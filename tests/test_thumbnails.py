@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of ThumbnailCache.
+
+"""
+
+import concurrent.futures
+import pathlib
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+# pylint: disable=wrong-import-position
+from utils.thumbnails import ThumbnailCache
+
+
+@pytest.fixture(name="source")
+def fixture_source(tmp_path: pathlib.Path) -> pathlib.Path:
+    """A 400x200 png image."""
+    source = tmp_path / "image.png"
+    Image.new("RGB", (400, 200), "red").save(source)
+    return source
+
+
+def test_thumbnail_is_cached(tmp_path: pathlib.Path, source: pathlib.Path) -> None:
+    cache = ThumbnailCache(tmp_path / "thumbnails", size=(100, 100), max_workers=1)
+    thumbnail_path = cache.thumbnail_path(source)
+    with Image.open(thumbnail_path) as thumbnail:
+        assert thumbnail.size == (100, 50)
+    assert cache.generate([source]) == {source: thumbnail_path}
+
+
+def test_same_thumbnail_created_by_several_threads(
+    tmp_path: pathlib.Path, source: pathlib.Path
+) -> None:
+    cache = ThumbnailCache(tmp_path / "thumbnails", size=(100, 100))
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        paths = set(executor.map(cache.thumbnail_path, [source] * 32))
+    assert len(paths) == 1
+    thumbnail_path = paths.pop()
+    assert list(thumbnail_path.parent.iterdir()) == [thumbnail_path]
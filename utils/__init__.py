@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+"""
+Various utilities.
+
+The public API is exposed lazily (PEP 562) : a submodule is only imported the first
+time one of its attributes is accessed. This way, a tool only needing Config does not
+pay for the import of PySide6 or Pillow.
+
+"""
+
+from __future__ import annotations
+
+import importlib
+
+# Importing typing costs more than the whole package otherwise would : TYPE_CHECKING
+# is therefore defined here, mypy recognizing it the same way as typing.TYPE_CHECKING.
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Dict, List
+
+    from utils.config import Config
+    from utils.functions import (
+        get_data_folder,
+        get_package_folder,
+        max_with_none,
+        min_with_none,
+    )
+    from utils.my_custom_widget import (
+        MyCustomWidget,
+        MyMsgBox,
+        MyThread,
+        display_info_while_running,
+        run_in_background,
+    )
+    from utils.stall_detector import StallDetector
+    from utils.thumbnails import ThumbnailCache
+
+_LAZY_ATTRIBUTES: Dict[str, str] = {
+    "Config": "utils.config",
+    "get_data_folder": "utils.functions",
+    "get_package_folder": "utils.functions",
+    "max_with_none": "utils.functions",
+    "min_with_none": "utils.functions",
+    "MyCustomWidget": "utils.my_custom_widget",
+    "MyMsgBox": "utils.my_custom_widget",
+    "MyThread": "utils.my_custom_widget",
+    "display_info_while_running": "utils.my_custom_widget",
+    "run_in_background": "utils.my_custom_widget",
+    "StallDetector": "utils.stall_detector",
+    "ThumbnailCache": "utils.thumbnails",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name: str) -> Any:
+    try:
+        module_name = _LAZY_ATTRIBUTES[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    module = importlib.import_module(module_name)
+    value = getattr(module, name)
+    # Caching the value in the module's namespace means __getattr__ is only called
+    # once per attribute.
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
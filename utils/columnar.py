@@ -0,0 +1,475 @@
+# -*- coding: utf-8 -*-
+
+"""
+Defines :
+ The ColumnarWriter class, writing DataRow tables in a columnar on-disk format.
+
+ The ColumnarTable class, opening such a file with mmap and giving zero-copy views on
+ its columns.
+
+ The Column class, a view on a single column of a ColumnarTable.
+
+File format
+-----------
+The file starts with a magic string, followed by the buffers of each column, aligned
+on 8 bytes, and ends with a json footer, its length (8 bytes, little-endian) and the
+magic string again. Each column has :
+
+- a null bitmap (bit i set if the value of row i is None),
+- either a buffer of 8-byte integers (int columns), or a buffer of 4-byte codes
+  referencing a dictionary of values (str and mixed columns),
+- for dictionary columns, the offsets (8-byte integers) and the utf-8 data of the
+  dictionary entries. Entries of mixed columns (holding values other than strs, such
+  as the floats and bools read from spreadsheets) are json-encoded.
+
+"""
+
+from __future__ import annotations
+
+import array
+import json
+import mmap
+import pathlib
+import shutil
+import struct
+import sys
+import tempfile
+from typing import (
+    IO,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from utils.my_types import CellValue, ColumnFilter, DataRow, Header, Headers
+
+MAGIC = b"DATAROW1"
+_FOOTER_LENGTH = struct.Struct("<Q")
+_ALIGNMENT = 8
+
+BufferLocation = Tuple[int, int]
+ViewFormat = Literal["B", "i", "q"]
+
+_SUPPORTED_TYPES = (int, float, str)
+
+
+class ColumnarWriter:
+
+    """
+    Writes a table in the columnar format, from batches of rows.
+
+    Each column is written to its own temporary file while the batches are received,
+    so that only the dictionaries of string values are held in memory. The final file
+    is assembled by close.
+
+    Parameters
+    ----------
+    file_path:
+        The path of the file to create.
+    headers:
+        The headers of the columns. Values of other headers in the rows are ignored,
+        and missing values are considered None.
+
+    Example
+    -------
+    ::
+
+        with ColumnarWriter(file_path, headers) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+
+    """
+
+    def __init__(self, file_path: pathlib.Path, headers: Headers) -> None:
+        self.file_path = file_path
+        self.headers = headers
+        self.rows_count = 0
+        self._temporary_folder = tempfile.TemporaryDirectory()
+        folder = pathlib.Path(self._temporary_folder.name)
+        self._columns = [
+            _ColumnBuilder(folder / f"column_{index}") for index in range(len(headers))
+        ]
+
+    def __enter__(self) -> ColumnarWriter:
+        return self
+
+    def __exit__(self, exc_type: Any, *exc_info: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._temporary_folder.cleanup()
+
+    def write_batch(self, rows: Sequence[DataRow]) -> None:
+        """
+        Appends a batch of rows to the table.
+
+        Values should be ints, floats (including bools), strs or None : a TypeError
+        is raised otherwise.
+        """
+        for header, column in zip(self.headers, self._columns):
+            column.append([row.get(header) for row in rows])
+        self.rows_count += len(rows)
+
+    def close(self) -> None:
+        """Assembles the final file, and removes the temporary files."""
+        try:
+            with open(self.file_path, "wb") as table_file:
+                table_file.write(MAGIC)
+                columns_description = [
+                    column.write_to(table_file, header)
+                    for header, column in zip(self.headers, self._columns)
+                ]
+                footer = json.dumps(
+                    {"rows": self.rows_count, "columns": columns_description}
+                ).encode("utf-8")
+                table_file.write(footer)
+                table_file.write(_FOOTER_LENGTH.pack(len(footer)))
+                table_file.write(MAGIC)
+        finally:
+            for column in self._columns:
+                column.close()
+            self._temporary_folder.cleanup()
+
+
+def write_table(
+    file_path: pathlib.Path, headers: Headers, batches: Iterable[Sequence[DataRow]]
+) -> None:
+    """Writes all batches of rows to a new columnar file."""
+    with ColumnarWriter(file_path, headers) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+
+
+class _ColumnBuilder:
+    def __init__(self, file_path: pathlib.Path) -> None:
+        self.kind = "int"
+        self.data_file: IO[bytes] = open(file_path, "w+b")
+        self.nulls = bytearray()
+        self.dictionary: Dict[Tuple[type, CellValue], int] = {}
+        self.count = 0
+
+    def append(self, values: List[Any]) -> None:
+        # Rows read from spreadsheets also hold floats and bools, despite CellValue.
+        for value in values:
+            if value is not None and not isinstance(value, _SUPPORTED_TYPES):
+                raise TypeError(
+                    f"Cannot store {value!r} of type {type(value).__name__} in a "
+                    f"columnar table"
+                )
+        # pylint: disable=unidiomatic-typecheck
+        if self.kind == "int" and any(
+            value is not None and type(value) is not int for value in values
+        ):
+            self._convert_to_dictionary()
+        for index, value in enumerate(values, start=self.count):
+            if index % 8 == 0:
+                self.nulls.append(0)
+            if value is None:
+                self.nulls[index >> 3] |= 1 << (index & 7)
+        self.count += len(values)
+        if self.kind == "int":
+            integers = [0 if value is None else value for value in values]
+            _to_little_endian(array.array("q", integers)).tofile(self.data_file)
+        else:
+            codes = [self._get_code(value) for value in values]
+            _to_little_endian(array.array("i", codes)).tofile(self.data_file)
+
+    def _is_null(self, index: int) -> bool:
+        return bool(self.nulls[index >> 3] & (1 << (index & 7)))
+
+    def _get_code(self, value: CellValue) -> int:
+        if value is None:
+            return 0
+        # The type is part of the key, so that 1 and "1" are different entries.
+        key = (type(value), value)
+        code = self.dictionary.get(key)
+        if code is None:
+            code = self.dictionary[key] = len(self.dictionary)
+        return code
+
+    def _convert_to_dictionary(self) -> None:
+        self.data_file.seek(0)
+        integers = array.array("q")
+        integers.frombytes(self.data_file.read())
+        _to_little_endian(integers)
+        self.data_file.seek(0)
+        self.data_file.truncate()
+        self.kind = "dictionary"
+        codes = array.array(
+            "i",
+            [
+                0 if self._is_null(index) else self._get_code(value)
+                for index, value in enumerate(integers)
+            ],
+        )
+        _to_little_endian(codes).tofile(self.data_file)
+
+    def write_to(self, table_file: IO[bytes], header: Header) -> Dict[str, Any]:
+        entries = [value for _, value in self.dictionary]
+        if self.kind == "int":
+            kind = "int"
+        elif all(isinstance(entry, str) for entry in entries):
+            kind = "str"
+        else:
+            kind = "mixed"
+        description: Dict[str, Any] = {"header": header, "kind": kind}
+        self.data_file.seek(0)
+        description["data"] = _write_buffer(table_file, self.data_file)
+        description["nulls"] = _write_buffer(table_file, bytes(self.nulls))
+        if kind != "int":
+            encoded_entries = [
+                (str(entry) if kind == "str" else json.dumps(entry)).encode("utf-8")
+                for entry in entries
+            ]
+            offsets = array.array("q", [0])
+            for encoded_entry in encoded_entries:
+                offsets.append(offsets[-1] + len(encoded_entry))
+            offsets_bytes = _to_little_endian(offsets).tobytes()
+            description["dictionary_offsets"] = _write_buffer(table_file, offsets_bytes)
+            description["dictionary_data"] = _write_buffer(
+                table_file, b"".join(encoded_entries)
+            )
+        return description
+
+    def close(self) -> None:
+        self.data_file.close()
+
+
+def _write_buffer(table_file: IO[bytes], buffer: Any) -> BufferLocation:
+    padding = -table_file.tell() % _ALIGNMENT
+    table_file.write(b"\0" * padding)
+    offset = table_file.tell()
+    if isinstance(buffer, bytes):
+        table_file.write(buffer)
+    else:
+        shutil.copyfileobj(buffer, table_file)
+    return offset, table_file.tell() - offset
+
+
+def _to_little_endian(buffer: array.array) -> array.array:
+    if sys.byteorder != "little":
+        buffer.byteswap()
+    return buffer
+
+
+class Column:
+
+    """
+    A zero-copy view on a column of a ColumnarTable.
+
+    For int columns, values is a view on the 8-byte integers. For str and mixed
+    columns, values is a view on the 4-byte codes, referencing the entries of the
+    dictionary. In both cases, the value of a null cell is meaningless, and is_null
+    should be checked first.
+
+    Warning
+    -------
+    Columns should not be instantiated directly, but rather through
+    ColumnarTable.column. The views are only valid while the table is open.
+
+    """
+
+    def __init__(self, table_map: mmap.mmap, description: Dict[str, Any]) -> None:
+        self.header: Header = description["header"]
+        self.kind: str = description["kind"]
+        buffer = memoryview(table_map)
+        self.values = _get_view(buffer, description["data"], self._get_format())
+        self.nulls = _get_view(buffer, description["nulls"], "B")
+        self._dictionary: Optional[List[CellValue]] = None
+        if self.kind != "int":
+            self._dictionary_offsets = _get_view(
+                buffer, description["dictionary_offsets"], "q"
+            )
+            self._dictionary_data = _get_view(
+                buffer, description["dictionary_data"], "B"
+            )
+
+    def _get_format(self) -> ViewFormat:
+        return "q" if self.kind == "int" else "i"
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, index: int) -> CellValue:
+        if self.is_null(index):
+            return None
+        value = self.values[index]
+        if self.kind != "int":
+            return self.get_dictionary()[value]
+        return value
+
+    def __iter__(self) -> Iterator[CellValue]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def is_null(self, index: int) -> bool:
+        """Whether the value of row index is None."""
+        return bool(self.nulls[index >> 3] & (1 << (index & 7)))
+
+    def get_dictionary(self) -> List[CellValue]:
+        """The distinct values of a str or mixed column, decoded on first use."""
+        if self._dictionary is None:
+            if self.kind == "int":
+                raise ValueError(f"Column {self.header} has no dictionary")
+            offsets = self._dictionary_offsets
+            data = self._dictionary_data.tobytes()
+            entries = [
+                data[offsets[index] : offsets[index + 1]].decode("utf-8")
+                for index in range(len(offsets) - 1)
+            ]
+            if self.kind == "mixed":
+                self._dictionary = [json.loads(entry) for entry in entries]
+            else:
+                self._dictionary = list(entries)
+        return self._dictionary
+
+    def filter_indices(
+        self, allowed_values: List[CellValue], indices: Optional[Iterable[int]] = None
+    ) -> List[int]:
+        """
+        The indices of the rows whose value is one of allowed_values.
+
+        For dictionary columns, the allowed values are translated once into codes, and
+        only the codes are compared.
+
+        Parameters
+        ----------
+        allowed_values:
+            The values to keep, as in a ColumnFilter.
+        indices:
+            If given, only those rows are checked.
+
+        """
+        keep_nulls = None in allowed_values
+        if self.kind == "int":
+            allowed = {value for value in allowed_values if isinstance(value, int)}
+        else:
+            allowed = {
+                code
+                for code, entry in enumerate(self.get_dictionary())
+                if entry in allowed_values
+            }
+        if indices is None:
+            indices = range(len(self))
+        values = self.values
+        return [
+            index
+            for index in indices
+            if (keep_nulls if self.is_null(index) else values[index] in allowed)
+        ]
+
+    def release(self) -> None:
+        """Releases the views, which is needed before the table can be closed."""
+        self.values.release()
+        self.nulls.release()
+        if self.kind != "int":
+            self._dictionary_offsets.release()
+            self._dictionary_data.release()
+
+
+def _get_view(
+    buffer: memoryview, location: List[int], view_format: ViewFormat
+) -> memoryview:
+    offset, length = location
+    view = buffer[offset : offset + length]
+    if view_format != "B":
+        view = view.cast(view_format)
+    return view
+
+
+class ColumnarTable:
+
+    """
+    A table in the columnar format, opened with mmap.
+
+    Opening a table only reads its footer : the columns are only paged in by the
+    operating system when they are read.
+
+    Parameters
+    ----------
+    file_path:
+        The path to a file written by ColumnarWriter.
+
+    Example
+    -------
+    ::
+
+        with ColumnarTable(file_path) as table:
+            indices = table.filter([("Country", ["France", "Spain"])])
+            for row in table.rows(indices):
+                ...
+
+    """
+
+    def __init__(self, file_path: pathlib.Path) -> None:
+        self.file_path = file_path
+        self._file = open(file_path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._columns: Dict[Header, Column] = {}
+        footer = self._read_footer()
+        self.rows_count: int = footer["rows"]
+        self._descriptions: Dict[Header, Dict[str, Any]] = {
+            description["header"]: description for description in footer["columns"]
+        }
+        self.headers: Headers = list(self._descriptions)
+
+    def _read_footer(self) -> Dict[str, Any]:
+        table_map = self._map
+        magic_length = len(MAGIC)
+        if table_map[:magic_length] != MAGIC or table_map[-magic_length:] != MAGIC:
+            raise ValueError(f"{self.file_path} is not a columnar table file")
+        footer_end = len(table_map) - magic_length
+        footer_start = footer_end - _FOOTER_LENGTH.size
+        (footer_length,) = _FOOTER_LENGTH.unpack(table_map[footer_start:footer_end])
+        footer: Dict[str, Any] = json.loads(
+            table_map[footer_start - footer_length : footer_start]
+        )
+        return footer
+
+    def __enter__(self) -> ColumnarTable:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.rows_count
+
+    def column(self, header: Header) -> Column:
+        """A zero-copy view on the column header."""
+        if header not in self._columns:
+            self._columns[header] = Column(self._map, self._descriptions[header])
+        return self._columns[header]
+
+    def filter(self, column_filters: List[ColumnFilter]) -> List[int]:
+        """The indices of the rows matching all column filters."""
+        indices: Optional[List[int]] = None
+        for header, allowed_values in column_filters:
+            indices = self.column(header).filter_indices(allowed_values, indices)
+        return list(range(self.rows_count)) if indices is None else indices
+
+    def rows(
+        self, indices: Optional[Iterable[int]] = None, headers: Optional[Headers] = None
+    ) -> Iterator[DataRow]:
+        """
+        The rows of the table, or only those at indices, with only the given headers.
+        """
+        columns = [self.column(header) for header in headers or self.headers]
+        if indices is None:
+            indices = range(self.rows_count)
+        for index in indices:
+            yield {column.header: column[index] for column in columns}
+
+    def close(self) -> None:
+        """Releases the column views and closes the file."""
+        for column in self._columns.values():
+            column.release()
+        self._columns = {}
+        self._map.close()
+        self._file.close()
@@ -4,16 +4,131 @@
 Defines :
  The Config class
 
+ The ConfigFuture class, the awaitable returned by the asynchronous methods of Config
+
 """
 
 
 from __future__ import annotations
 
+import contextlib
+import importlib
+import os
 import pathlib
-from typing import Dict, Optional, Union, Any
+import sys
+import threading
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    Generic,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from utils import diagnostics, instrumentation
+
+if TYPE_CHECKING:
+    # concurrent.futures imports logging, and is only needed by the asynchronous API.
+    import concurrent.futures
+
+    from utils.config_journal import ConfigJournal
 
 ParameterValue = Union[int, str, pathlib.Path]
 Parameters = Dict[str, ParameterValue]
+# In compact mode, typed values are only decoded the first time they are read.
+StoredValue = Union[ParameterValue, "_EncodedValue"]
+InstanceKey = Tuple[pathlib.Path, str, bool, bool]
+ValueDecoder = Callable[[str], Any]
+DerivedFunction = Callable[..., Any]
+
+MyType = TypeVar("MyType")
+
+_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> concurrent.futures.ThreadPoolExecutor:
+    # The executor is only created when first needed, so that programs not using the
+    # asynchronous API do not start any thread.
+    # pylint: disable=global-statement, import-outside-toplevel, redefined-outer-name
+    global _executor
+    import concurrent.futures
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=4, thread_name_prefix="config-io"
+            )
+    return _executor
+
+
+class ConfigFuture(Generic[MyType]):
+
+    """
+    The result of an I/O operation running on the config executor.
+
+    It can be awaited from a coroutine, or used without any asyncio event loop, for
+    instance from Qt code, with add_done_callback or result.
+
+    Warning
+    -------
+    Callbacks are run in the executor thread. In Qt code, they should only emit a
+    signal, and not modify any widget directly.
+
+    """
+
+    def __init__(self, future: concurrent.futures.Future) -> None:
+        self._future = future
+
+    def __await__(self) -> Generator[Any, None, MyType]:
+        # asyncio is only imported when actually used, as it is slow to import.
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        return asyncio.wrap_future(self._future).__await__()
+
+    def add_done_callback(self, func: Callable[[ConfigFuture[MyType]], Any]) -> None:
+        """Calls func with the future as its only argument when it is done."""
+        self._future.add_done_callback(lambda _: func(self))
+
+    def done(self) -> bool:
+        """Whether the operation has finished running."""
+        return self._future.done()
+
+    def result(self, timeout: Optional[float] = None) -> MyType:
+        """Waits for the operation to finish, and returns its result or raises."""
+        result: MyType = self._future.result(timeout)
+        return result
+
+    def exception(self, timeout: Optional[float] = None) -> Optional[BaseException]:
+        """Waits for the operation to finish, and returns the exception it raised."""
+        return self._future.exception(timeout)
+
+
+class _EncodedValue:
+
+    """
+    A value read from the backing store, and not decoded yet (compact storage mode).
+    """
+
+    __slots__ = ("raw", "prefix_length", "decoder")
+
+    def __init__(self, raw: str, prefix_length: int, decoder: ValueDecoder) -> None:
+        self.raw = raw
+        self.prefix_length = prefix_length
+        self.decoder = decoder
+
+    def decode(self) -> Any:
+        """The decoded value."""
+        return self.decoder(self.raw[self.prefix_length :])
 
 
 class Config:
@@ -33,69 +148,471 @@ class Config:
 
     """
 
+    _backends: Dict[str, str] = {
+        ".toml": "utils.config_toml.ConfigToml",
+        ".ini": "utils.config_database.ConfigDatabase",
+        ".txt": "utils.config_database.ConfigDatabase",
+        ".json": "utils.config_json.ConfigJson",
+        ".marshal": "utils.config_marshal.ConfigMarshal",
+    }
+    """
+    The classes used for each suffix of config file, see register_backend.
+    """
+
+    value_decoders: Dict[str, ValueDecoder] = {"PathObject:": pathlib.Path}
+    """
+    The functions used to decode string values starting with a given prefix. The
+    prefix is removed from the string before the function is called.
+    """
+
+    _instances: Dict[InstanceKey, Config] = {}
+    _instances_lock = threading.RLock()
+    # The locks held while a shared config is being created, so that creating
+    # configs for other files is not blocked by a slow file or database.
+    _creation_locks: Dict[InstanceKey, threading.Lock] = {}
+
     def __init__(self, config_file: pathlib.Path) -> None:
-        self.data: Parameters = {}
+        self.data: Dict[str, StoredValue] = {}
         self.config_file = config_file
+        self.compact = False
+        self.lazy = False
+        self._pending_save: Optional[ConfigFuture[None]] = None
+        self._pending_save_lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._journal: Optional[ConfigJournal] = None
+        self._options: Optional[Parameters] = None
+        self._instance_key: Optional[InstanceKey] = None
+        self._derived_parameters: Dict[str, Tuple[List[str], DerivedFunction]] = {}
+        self._derived_values: Dict[str, Any] = {}
+        self._dependents: Dict[str, Set[str]] = {}
+        self._derived_lock = threading.RLock()
 
     @staticmethod
     def create(
-        config_file: pathlib.Path, options: Optional[Parameters] = None
+        config_file: pathlib.Path,
+        options: Optional[Parameters] = None,
+        autosave: bool = False,
+        shared: bool = True,
+        compact: bool = False,
+        lazy: bool = False,
     ) -> Config:
         """
         Factory method to create a config object.
 
+        The config objects are shared : creating a config for the same file (even
+        through a different path) and with the same options returns the same object,
+        without reading the file again. All modules therefore see the same values.
+        Config.release and Config.reload allow to drop or refresh a shared config.
+
         Depending on the extension of the file given as input, the appropriate
-        derived class will be called. Two options are available : either the values can
-        be stored in a toml file, or they are stored in a sqlite database. In that
-        second case, all values should be in a table named "Parameter", with columns
-        "name", "value", "description" and "group".
+        derived class will be called. The values can be stored in a toml file, a json
+        file, a marshal file, or in a sqlite database. In that last case, all values
+        should be in a table named "Parameter", with columns "name", "value",
+        "description" and "group". Other formats can be added with
+        Config.register_backend.
 
         Parameters
         ----------
         config_file:
-            The file holding the main information. That file can either be a toml file,
-            directly holding the parameter values, or a .txt or .ini file, with a
-            single line holding the path to a sqlite database.
+            The file holding the main information. That file can either be a toml,
+            json or marshal file, directly holding the parameter values, or a .txt or
+            .ini file, with a single line holding the path to a sqlite database.
         options:
             A dictionary can be given at creation, with values meant to override
             existing default values, or with entirely new parameters not present in the
             default parameters.
+        autosave:
+            Whether to enable the autosave mode, with its default settings (see
+            enable_autosave).
+        shared:
+            If False, a new config object is created, and is not shared with
+            subsequent calls.
+        compact:
+            Whether to use the compact storage mode : parameter names are interned,
+            and typed values (such as paths) are only decoded the first time they are
+            read. This saves memory and loading time for configs with many
+            parameters, most of them never being read. In that mode, typed values in
+            config.data might not be decoded yet, and should be read with the bracket
+            notation.
+        lazy:
+            Whether the parts of the config stored in separate files (the shards of a
+            toml config) are only read the first time one of their values is read.
+            Such values are missing from config.data until then, and should be read
+            with the bracket notation.
+
+        Changes left in an autosave journal by a program that crashed are replayed
+        and saved before the options are applied.
 
         """
         # create_main_widget is a factory method, and should therefore be allowed
         # to access protected members of the class.
         # pylint: disable = protected-access
+        if not shared:
+            config = Config._create_new_config(config_file, options, compact, lazy)
+        else:
+            config = Config._get_shared_config(config_file, options, compact, lazy)
+        if autosave:
+            config.enable_autosave()
+        return config
+
+    @staticmethod
+    def _get_shared_config(
+        config_file: pathlib.Path,
+        options: Optional[Parameters],
+        compact: bool,
+        lazy: bool,
+    ) -> Config:
+        # pylint: disable = protected-access
+        instance_key = Config._get_instance_key(config_file, options, compact, lazy)
+        with Config._instances_lock:
+            config = Config._instances.get(instance_key)
+            if config is not None:
+                return config
+            creation_lock = Config._creation_locks.setdefault(
+                instance_key, threading.Lock()
+            )
+        # The file is read outside of the global lock : only the threads creating a
+        # config for the same key wait for it.
+        with creation_lock:
+            with Config._instances_lock:
+                config = Config._instances.get(instance_key)
+            if config is None:
+                config = Config._create_new_config(config_file, options, compact, lazy)
+                config._instance_key = instance_key
+                with Config._instances_lock:
+                    Config._instances[instance_key] = config
+                    del Config._creation_locks[instance_key]
+        return config
+
+    @staticmethod
+    def _create_new_config(
+        config_file: pathlib.Path,
+        options: Optional[Parameters],
+        compact: bool,
+        lazy: bool,
+    ) -> Config:
+        # pylint: disable = protected-access
+        instrumentation.increment("Config.create")
         config = Config._create_config_object(config_file)
+        config.compact = compact
+        config.lazy = lazy
         assert hasattr(config, "load")
-        config.load()  # type: ignore
+        with instrumentation.span("Config.load"):
+            config.load()  # type: ignore
+        config._replay_journal()
+        config._options = options
         config._load_options(options)
+        diagnostics.track(config)
         return config
 
+    @staticmethod
+    def _get_instance_key(
+        config_file: pathlib.Path,
+        options: Optional[Parameters],
+        compact: bool,
+        lazy: bool,
+    ) -> InstanceKey:
+        # Options might hold unhashable values (arrays), hence the use of repr.
+        options_key = repr(sorted(options.items())) if options else ""
+        return config_file.resolve(), options_key, compact, lazy
+
+    def release(self) -> None:
+        """
+        Stops sharing the config.
+
+        The next call to Config.create for the same file and options will read the
+        file again and return a new object. In autosave mode, pending changes are
+        saved first.
+        """
+        self.disable_autosave()
+        with Config._instances_lock:
+            if Config._instances.get(self._instance_key) is self:  # type: ignore
+                del Config._instances[self._instance_key]  # type: ignore
+            self._instance_key = None
+
+    def reload(self) -> None:
+        """
+        Reads the values again from the file or database, in place.
+
+        Values that have not been saved are lost, except in autosave mode where
+        pending changes are saved first. The options given at creation are applied
+        again. Only the derived parameters depending on values that actually changed
+        are computed again.
+        """
+        assert hasattr(self, "load")
+        self.flush()
+        previous_values = {
+            name: self.translate_value(value) for name, value in self.data.items()
+        }
+        # The options should not end up in the autosave journal, and derived values
+        # are only invalidated once all values are known.
+        journal, self._journal = self._journal, None
+        dependents, self._dependents = self._dependents, {}
+        try:
+            self.data.clear()
+            with instrumentation.span("Config.load"):
+                self.load()  # type: ignore
+            self._load_options(self._options)
+        finally:
+            self._journal = journal
+            self._dependents = dependents
+        for name in previous_values.keys() | self.data.keys():
+            is_changed = (
+                name not in previous_values
+                or name not in self.data
+                or previous_values[name] != self.translate_value(self.data[name])
+            )
+            if is_changed:
+                self._invalidate(name)
+
+    @staticmethod
+    def acreate(
+        config_file: pathlib.Path,
+        options: Optional[Parameters] = None,
+        autosave: bool = False,
+        shared: bool = True,
+        compact: bool = False,
+        lazy: bool = False,
+    ) -> ConfigFuture[Config]:
+        """
+        Asynchronous version of Config.create, taking the same parameters.
+
+        The file or database is read on the config executor, and the returned future
+        can either be awaited, or used from Qt code through its callbacks.
+
+        """
+        future = _get_executor().submit(
+            Config.create, config_file, options, autosave, shared, compact, lazy
+        )
+        return ConfigFuture(future)
+
+    def aload(self) -> ConfigFuture[None]:
+        """Asynchronous version of load, running on the config executor."""
+        assert hasattr(self, "load")
+        future = _get_executor().submit(self.load)  # type: ignore
+        return ConfigFuture(future)
+
+    def asave(self) -> ConfigFuture[None]:
+        """
+        Asynchronous version of save, running on the config executor.
+
+        Saves of the same config are serialized. A save which has not started yet
+        writes the values as they are when it starts : later calls made while it is
+        waiting are therefore collapsed into it, and return the same future.
+
+        """
+        with self._pending_save_lock:
+            if self._pending_save is None:
+                future = _get_executor().submit(self._run_pending_save)
+                self._pending_save = ConfigFuture(future)
+            return self._pending_save
+
+    def _run_pending_save(self) -> None:
+        with self._save_lock:
+            with self._pending_save_lock:
+                self._pending_save = None
+            assert hasattr(self, "save")
+            self.save()  # type: ignore
+
+    @staticmethod
+    def register_backend(suffix: str, class_path: str) -> None:
+        """
+        Registers the class used by Config.create for files with the given suffix.
+
+        Parameters
+        ----------
+        suffix:
+            The suffix of the config files, including the leading dot (ex: ".toml").
+        class_path:
+            The full path to the class derived from Config, in the form
+            "package.module.ClassName". The module is only imported when a file with
+            that suffix is actually used.
+
+        """
+        Config._backends[suffix] = class_path
+
     @staticmethod
     def _create_config_object(config_file: pathlib.Path) -> Config:
         # We only import the appropriate subclass, because they each have specific
         # dependencies.
-        # pylint: disable = import-outside-toplevel
-        if config_file.suffix == ".toml":
-            from utils.config_toml import ConfigToml
-
-            config: Config = ConfigToml(config_file)
-        elif config_file.suffix in [".ini", ".txt"]:
-            from utils.config_database import ConfigDatabase
-
-            config = ConfigDatabase(config_file)
-        else:
+        try:
+            class_path = Config._backends[config_file.suffix]
+        except KeyError:
             raise ValueError(
                 f"{config_file} is of type {config_file.suffix}. The only acceptable "
-                f"types are toml, ini, txt."
-            )
+                f"types are {', '.join(suffix[1:] for suffix in Config._backends)}."
+            ) from None
+        module_name, class_name = class_path.rsplit(".", 1)
+        config_class = getattr(importlib.import_module(module_name), class_name)
+        config: Config = config_class(config_file)
         return config
 
+    @staticmethod
+    @contextlib.contextmanager
+    def _open_for_replacement(
+        file_path: pathlib.Path, mode: str
+    ) -> Iterator[IO[Any]]:
+        # The new content is written to a temporary file, which then replaces the
+        # file : a crash while saving leaves either the old or the new content, but
+        # never a truncated file.
+        # tempfile is slow to import, and only needed by the file backends.
+        import tempfile  # pylint: disable=import-outside-toplevel
+
+        file_descriptor, temporary_name = tempfile.mkstemp(
+            dir=file_path.parent, prefix=f".{file_path.name}.", suffix=".tmp"
+        )
+        try:
+            with open(file_descriptor, mode) as temporary_file:
+                yield temporary_file
+            if file_path.exists():
+                os.chmod(temporary_name, file_path.stat().st_mode)
+            os.replace(temporary_name, file_path)
+        except BaseException:
+            os.remove(temporary_name)
+            raise
+
     def __getitem__(self, item: str) -> Any:
-        return self.data[item]
+        try:
+            value = self.data[item]
+        except KeyError:
+            if item in self._derived_parameters:
+                return self._get_derived_value(item)
+            raise
+        if type(value) is _EncodedValue:  # pylint: disable=unidiomatic-typecheck
+            # The decoded value replaces the encoded one, so that it is decoded once.
+            value = self.data[item] = value.decode()
+        return value
 
     def __setitem__(self, item: str, value: Any) -> None:
+        self._set_value(item, value)
+        if self._journal is not None:
+            self._journal.append(item, value)
+
+    def _set_value(self, item: str, value: Any) -> None:
+        # Values read from the backing store are set without being journaled.
         self.data[item] = value
+        if item in self._dependents:
+            self._invalidate(item)
+
+    def register_derived(
+        self, name: str, sources: List[str], function: DerivedFunction
+    ) -> None:
+        """
+        Registers a parameter computed from the values of other parameters.
+
+        The derived value is read with the bracket notation, like any other value. It
+        is only computed when first read, and then memoized until one of its sources
+        changes, through the bracket notation, the options or Config.reload. Derived
+        values are never saved.
+
+        Parameters
+        ----------
+        name:
+            The name of the derived parameter, which should not be the name of a
+            stored parameter.
+        sources:
+            The names of the parameters the value depends on. They can be derived
+            parameters themselves.
+        function:
+            The function computing the value, called with the values of the sources,
+            in the same order.
+
+        Example
+        -------
+        ::
+
+            config.register_derived(
+                "thumbnails_folder",
+                ["data_folder"],
+                lambda data_folder: data_folder / "thumbnails",
+            )
+
+        """
+        if name in self.data:
+            raise ValueError(f"{name} is already a stored parameter")
+        if name in sources or name in self._get_all_sources(sources):
+            raise ValueError(f"{name} cannot depend on itself")
+        with self._derived_lock:
+            if name in self._derived_parameters:
+                for source in self._derived_parameters[name][0]:
+                    self._dependents[source].discard(name)
+            self._derived_parameters[name] = (list(sources), function)
+            for source in sources:
+                self._dependents.setdefault(source, set()).add(name)
+            self._invalidate(name)
+
+    def _get_all_sources(self, sources: List[str]) -> Set[str]:
+        all_sources: Set[str] = set()
+        remaining = list(sources)
+        while remaining:
+            source = remaining.pop()
+            if source not in all_sources:
+                all_sources.add(source)
+                if source in self._derived_parameters:
+                    remaining.extend(self._derived_parameters[source][0])
+        return all_sources
+
+    def _get_derived_value(self, name: str) -> Any:
+        with self._derived_lock:
+            try:
+                return self._derived_values[name]
+            except KeyError:
+                sources, function = self._derived_parameters[name]
+                value = function(*(self[source] for source in sources))
+                self._derived_values[name] = value
+                return value
+
+    def _invalidate(self, name: str) -> None:
+        # Drops the memoized values depending, directly or not, on name.
+        with self._derived_lock:
+            self._derived_values.pop(name, None)
+            for dependent in self._dependents.get(name, ()):
+                self._invalidate(dependent)
+
+    def enable_autosave(
+        self, quiet_period: float = 2.0, max_changes: int = 100
+    ) -> None:
+        """
+        Saves the config automatically after each change.
+
+        Each change made with the bracket notation is immediately written to a journal
+        file next to the config file. The config is then saved in a background thread
+        once no change has been made for quiet_period seconds, or once max_changes
+        changes are waiting to be saved.
+
+        Only one config object of the process can be in autosave mode for a given
+        file : a ValueError is raised otherwise.
+
+        """
+        # pylint: disable=import-outside-toplevel
+        from utils.config_journal import ConfigJournal
+
+        if self._journal is None:
+            self._journal = ConfigJournal(self, quiet_period, max_changes)
+
+    def disable_autosave(self) -> None:
+        """Saves the pending changes and stops the autosave mode."""
+        if self._journal is not None:
+            journal, self._journal = self._journal, None
+            journal.close()
+
+    def flush(self) -> None:
+        """In autosave mode, saves the pending changes without waiting."""
+        if self._journal is not None:
+            self._journal.flush()
+
+    def _replay_journal(self) -> None:
+        # pylint: disable=import-outside-toplevel
+        from utils.config_journal import ConfigJournal
+
+        journal_path = ConfigJournal.get_journal_path(self.config_file)
+        # A journal used by a live config object holds changes not saved yet, and is
+        # not left over by a crash.
+        if journal_path.exists() and not ConfigJournal.is_open(journal_path):
+            for name, value in ConfigJournal.read_entries(journal_path):
+                self._load_parameter(name, value)
+            self.save()  # type: ignore
+            journal_path.unlink()
 
     def _load_options(self, options: Optional[Parameters]) -> None:
         if options is not None:
@@ -103,13 +620,20 @@ class Config:
                 self[item] = value
 
     def _load_parameter(self, name: str, value: Any) -> None:
-        if isinstance(value, str) and value.startswith("PathObject:"):
-            path_as_string = value[len("PathObject:") :]
-            value = pathlib.Path(path_as_string)
-        self[name] = value
+        if isinstance(value, str):
+            for prefix, decoder in self.value_decoders.items():
+                if value.startswith(prefix):
+                    if self.compact:
+                        value = _EncodedValue(value, len(prefix), decoder)
+                    else:
+                        value = decoder(value[len(prefix) :])
+                    break
+        if self.compact:
+            name = sys.intern(name)
+        self._set_value(name, value)
 
     @staticmethod
-    def translate_value(value: ParameterValue) -> ParameterValue:
+    def translate_value(value: StoredValue) -> ParameterValue:
         """
         Transforms a pathlib.Path object in a string.
 
@@ -121,4 +645,6 @@ class Config:
         """
         if isinstance(value, pathlib.Path):
             value = "PathObject:" + str(value)
+        elif isinstance(value, _EncodedValue):
+            value = value.raw
         return value
@@ -9,9 +9,12 @@ Defines :
 
 import json
 import pathlib
+from typing import Type
 
 import peewee
+from playhouse.pool import PooledSqliteDatabase
 
+from utils import instrumentation
 from utils.config import Config
 
 
@@ -30,6 +33,11 @@ class ConfigDatabase(Config):
     Class derived from Config, specific to information being stored in an sqlite
     database.
 
+    Each instance binds its own copy of the Parameter model to its database, so that
+    several ConfigDatabase can be used in the same process. The database is opened in
+    WAL mode, and each thread gets its own connection from a pool, which allows reads
+    from worker threads to run alongside writes from the GUI thread.
+
     Warning
     -------
     The class should not be instantiated directly, but rather through the Config.create
@@ -38,29 +46,70 @@ class ConfigDatabase(Config):
 
     """
 
+    pragmas = {
+        "foreign_keys": 1,
+        "journal_mode": "wal",
+        "synchronous": "normal",
+        "cache_size": -8000,
+        "temp_store": "memory",
+    }
+    """
+    The pragmas applied to each new connection. WAL mode is not supported by sqlite
+    on network file systems, where journal_mode should be set back to "delete".
+    """
+
+    max_connections: int = 8
+    """The maximum number of connections opened at the same time, one per thread."""
+
     def __init__(self, ini_file: pathlib.Path) -> None:
         super().__init__(ini_file)
         self.database = self._get_database()
-        Parameter._meta.database = self.database  # pylint: disable=no-member
+        self.parameter_model = self._create_parameter_model()
 
-    def _get_database(self) -> peewee.SqliteDatabase:
+    def _get_database(self) -> PooledSqliteDatabase:
         with open(self.config_file, "r") as ini_file:
             planning_db_path = pathlib.Path(ini_file.read().strip())
-            database = peewee.SqliteDatabase(
-                planning_db_path, pragmas={"foreign_keys": 1}
+            database = PooledSqliteDatabase(
+                planning_db_path,
+                pragmas=self.pragmas,
+                max_connections=self.max_connections,
+                stale_timeout=300,
+                timeout=10,
+                # Connections returned to the pool are reused by other threads. A
+                # connection is still only used by one thread at a time.
+                check_same_thread=False,
             )
         return database
 
+    def _create_parameter_model(self) -> Type[Parameter]:
+        # A subclass per instance, rather than binding Parameter itself, prevents
+        # two instances from overwriting each other's database.
+        meta = type(
+            "Meta",
+            (),
+            {
+                "database": self.database,
+                "table_name": Parameter._meta.table_name,  # pylint: disable=no-member
+            },
+        )
+        parameter_model: Type[Parameter] = type(
+            "Parameter", (Parameter,), {"Meta": meta, "__module__": __name__}
+        )
+        return parameter_model
+
     def load(self) -> None:
         """Loads values from the sqlite database."""
-        for parameter in Parameter.select():
-            json_value = json.loads(parameter.value)
-            self._load_parameter(parameter.name, json_value)
+        with self.database.connection_context():
+            for parameter in self.parameter_model.select():
+                json_value = json.loads(parameter.value)
+                self._load_parameter(parameter.name, json_value)
 
+    @instrumentation.timed()
     def save(self) -> None:
-        """Saves values to the sqlite database."""
-        for name, value in self.data.items():
-            parameter = Parameter.get_or_create(name=name)[0]
-            value = self.translate_value(value)
-            parameter.value = json.dumps(value)
-            parameter.save()
+        """Saves values to the sqlite database, in a single transaction."""
+        with self.database.connection_context(), self.database.atomic():
+            for name, value in list(self.data.items()):
+                parameter = self.parameter_model.get_or_create(name=name)[0]
+                value = self.translate_value(value)
+                parameter.value = json.dumps(value)
+                parameter.save()
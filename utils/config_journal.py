@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""
+Defines :
+ The ConfigJournal class, implementing the autosave mode of Config.
+
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Iterator, Set, Tuple
+
+if TYPE_CHECKING:
+    from utils.config import Config
+
+_logger = logging.getLogger(__name__)
+
+
+class ConfigJournal:
+
+    """
+    An append-only journal of the changes made to a config, folded into the config's
+    backing store by a background thread.
+
+    Each change is written to the journal as soon as it is made, which only costs a
+    single line appended to a file. The whole config is then saved once no change
+    has been made for quiet_period seconds, or once max_changes changes are waiting,
+    and the journal is emptied. If the program crashes in between, the changes are
+    replayed from the journal the next time the config is created.
+
+    Only one config object of the process can use the journal of a given file at a
+    time.
+
+    A save failing in the background thread (for instance because the file is locked
+    or the disk is full) is logged, and retried after quiet_period seconds. The
+    changes are kept in the journal in the meantime.
+
+    Warning
+    -------
+    The class should not be instantiated directly, but rather through
+    Config.enable_autosave.
+
+    """
+
+    _open_journals: Set[pathlib.Path] = set()
+    _open_journals_lock = threading.Lock()
+
+    def __init__(self, config: Config, quiet_period: float, max_changes: int) -> None:
+        self.config = config
+        self.file_path = self.get_journal_path(config.config_file)
+        with ConfigJournal._open_journals_lock:
+            if self.file_path in ConfigJournal._open_journals:
+                raise ValueError(
+                    f"Autosave is already enabled for {config.config_file} by another "
+                    f"config object"
+                )
+            ConfigJournal._open_journals.add(self.file_path)
+        self.quiet_period = quiet_period
+        self.max_changes = max_changes
+        self._file = open(self.file_path, "ab")
+        self._condition = threading.Condition()
+        self._pending_changes = 0
+        self._last_change = 0.0
+        self._retry_at = 0.0
+        self._is_closed = False
+        self._flusher = threading.Thread(
+            target=self._run_flusher, name="config-journal-flusher", daemon=True
+        )
+        self._flusher.start()
+
+    @staticmethod
+    def get_journal_path(config_file: pathlib.Path) -> pathlib.Path:
+        """The path to the journal associated with config_file."""
+        config_file = config_file.resolve()
+        return config_file.with_name(config_file.name + ".journal")
+
+    @staticmethod
+    def is_open(journal_path: pathlib.Path) -> bool:
+        """Whether a config object of this process is currently using the journal."""
+        with ConfigJournal._open_journals_lock:
+            return journal_path in ConfigJournal._open_journals
+
+    @staticmethod
+    def read_entries(journal_path: pathlib.Path) -> Iterator[Tuple[str, Any]]:
+        """
+        Yields the (name, value) pairs written in a journal, oldest first.
+
+        A last line only partially written, because of a crash, is ignored.
+        """
+        with open(journal_path, "rb") as journal_file:
+            for line in journal_file:
+                try:
+                    name, value = json.loads(line)
+                except ValueError:
+                    break
+                yield name, value
+
+    def append(self, name: str, value: Any) -> None:
+        """Writes a change to the journal, and schedules the next flush."""
+        value = self.config.translate_value(value)
+        line = (json.dumps([name, value]) + "\n").encode("utf-8")
+        with self._condition:
+            self._file.write(line)
+            self._file.flush()
+            self._pending_changes += 1
+            self._last_change = time.monotonic()
+            self._condition.notify()
+
+    def flush(self) -> None:
+        """Saves the config and removes the changes it includes from the journal."""
+        with self._condition:
+            flushed_changes = self._pending_changes
+            flushed_size = self._file.tell()
+        with self.config._save_lock:  # pylint: disable=protected-access
+            self.config.save()  # type: ignore
+        with self._condition:
+            self._pending_changes = max(0, self._pending_changes - flushed_changes)
+            self._truncate(flushed_size)
+
+    def close(self) -> None:
+        """Flushes the remaining changes, stops the flusher and removes the journal."""
+        with self._condition:
+            self._is_closed = True
+            self._condition.notify()
+        self._flusher.join()
+        # If the last save fails, the journal is kept, and replayed the next time the
+        # config is created.
+        try:
+            self.flush()
+        finally:
+            self._file.close()
+            with ConfigJournal._open_journals_lock:
+                ConfigJournal._open_journals.discard(self.file_path)
+        os.remove(self.file_path)
+
+    def _run_flusher(self) -> None:
+        while self._wait_for_flush():
+            try:
+                self.flush()
+            except Exception:  # pylint: disable=broad-except
+                _logger.exception("Could not save %s", self.config.config_file)
+                with self._condition:
+                    self._retry_at = time.monotonic() + self.quiet_period
+
+    def _wait_for_flush(self) -> bool:
+        with self._condition:
+            while not self._is_closed:
+                if self._pending_changes == 0:
+                    self._condition.wait()
+                    continue
+                now = time.monotonic()
+                if now < self._retry_at:
+                    self._condition.wait(self._retry_at - now)
+                    continue
+                remaining = self._last_change + self.quiet_period - now
+                if self._pending_changes >= self.max_changes or remaining <= 0:
+                    return True
+                self._condition.wait(remaining)
+        return False
+
+    def _truncate(self, flushed_size: int) -> None:
+        # Changes appended while the config was being saved might not be included in
+        # the save : they are kept in the journal. Replaying them again is harmless,
+        # as they are more recent than anything in the backing store.
+        with open(self.file_path, "rb") as journal_file:
+            journal_file.seek(flushed_size)
+            remaining_changes = journal_file.read()
+        self._file.truncate(0)
+        self._file.write(remaining_changes)
+        self._file.flush()
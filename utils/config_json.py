@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+"""
+Defines :
+ The ConfigJson class, derived from Config
+
+"""
+
+import json
+
+from utils.config import Config
+
+
+class ConfigJson(Config):
+
+    """
+    Class derived from Config, specific to information being stored in a .json file.
+
+    Warning
+    -------
+    The class should not be instantiated directly, but rather through the Config.create
+    factory method, that will return the appropriate derived class (depending on the
+    type of file holding those parameters).
+
+    """
+
+    def load(self) -> None:
+        """Loads values from the json file."""
+        with open(self.config_file, "r") as json_file:
+            json_dict = json.load(json_file)
+        for name, value in json_dict.items():
+            self._load_parameter(name, value)
+
+    def save(self) -> None:
+        """Saves values to the json file."""
+        json_dict = {
+            name: self.translate_value(value) for name, value in list(self.data.items())
+        }
+        with self._open_for_replacement(self.config_file, "w") as json_file:
+            json.dump(json_dict, json_file, indent=4)
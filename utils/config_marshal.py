@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+"""
+Defines :
+ The ConfigMarshal class, derived from Config
+
+"""
+
+import marshal
+
+from utils.config import Config
+
+
+class ConfigMarshal(Config):
+
+    """
+    Class derived from Config, specific to information being stored in a binary file,
+    using the marshal format.
+
+    The marshal format is the fastest to load and save, but the file is not human
+    readable, and might not be read by another version of Python. It is therefore
+    meant for machine-generated configs.
+
+    Warning
+    -------
+    The class should not be instantiated directly, but rather through the Config.create
+    factory method, that will return the appropriate derived class (depending on the
+    type of file holding those parameters).
+
+    """
+
+    def load(self) -> None:
+        """Loads values from the marshal file."""
+        with open(self.config_file, "rb") as marshal_file:
+            marshal_dict = marshal.load(marshal_file)
+        for name, value in marshal_dict.items():
+            self._load_parameter(name, value)
+
+    def save(self) -> None:
+        """Saves values to the marshal file."""
+        marshal_dict = {
+            name: self.translate_value(value) for name, value in list(self.data.items())
+        }
+        with self._open_for_replacement(
+            self.config_file, "wb"
+        ) as marshal_file:
+            marshal.dump(marshal_dict, marshal_file)
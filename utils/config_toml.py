@@ -5,10 +5,31 @@ Defines :
  The ConfigToml class, derived from Config
 
 """
-from typing import List
+import concurrent.futures
+import json
+import pathlib
+import re
+import sys
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
 import toml
-from utils.config import Config, ParameterValue
+from utils import instrumentation
+from utils.config import Config
+
+# The stdlib reader (python >= 3.11) is much faster than the pure-python toml package,
+# which is still needed to write the files. The version is checked, rather than the
+# import, so that mypy knows which branches are used.
+if sys.version_info >= (3, 11):
+    import tomllib
+
+_KEY_PART = r"""(?:[A-Za-z0-9_-]+|"(?:[^"\\]|\\.)*"|'[^']*')"""
+_DOTTED_KEY = rf"{_KEY_PART}(?:\s*\.\s*{_KEY_PART})*"
+_KEY_PART_PATTERN = re.compile(_KEY_PART)
+_BARE_KEY_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+_KEY_LINE_PATTERN = re.compile(rf"^(\s*)({_DOTTED_KEY})\s*=\s*(.*)$", re.DOTALL)
+_TABLE_LINE_PATTERN = re.compile(rf"^\s*\[\s*({_DOTTED_KEY})\s*\]")
+_ARRAY_TABLE_LINE_PATTERN = re.compile(rf"^\s*\[\[\s*({_DOTTED_KEY})\s*\]\]")
 
 
 class ConfigToml(Config):
@@ -16,6 +37,25 @@ class ConfigToml(Config):
     """
     Class derived from Config, specific to information being stored in a .toml file.
 
+    Nested tables, including inline tables, are flattened into dotted keys when the
+    file is loaded : the value of size in the table [db.pool] is accessed with
+    config["db.pool.size"]. Arrays of tables are kept as lists of dictionaries, and
+    are written again as a whole when modified. A quoted key holding a dot ("a.b")
+    and a nested key (a.b) are both flattened into "a.b" : a ValueError is raised
+    when a file holds both.
+
+    A large config can be split into shards, declared in an __include__ table of the
+    main file. Each entry maps a prefix to the path of a shard file (relative to the
+    main file), whose keys are then accessed under that prefix::
+
+        [__include__]
+        db = "shards/db.toml"   # pool.size in db.toml is read as config["db.pool.size"]
+
+    Shards are parsed in a thread pool when the config is loaded or, for configs
+    created with lazy=True (or for all configs if load_shards_lazily is True), the
+    first time one of their keys is read. Only the files holding modified values are
+    written when saving.
+
     Warning
     -------
     The class should not be instantiated directly, but rather through the Config.create
@@ -24,29 +64,225 @@ class ConfigToml(Config):
 
     """
 
+    include_key: str = "__include__"
+    """The name of the table declaring the shards in the main file."""
+
+    load_shards_lazily: bool = False
+    """
+    Whether shards are only parsed the first time one of their keys is read, rather
+    than when the config is loaded, for all configs. Config.create(..., lazy=True)
+    does the same for a single config.
+    """
+
+    def __init__(self, config_file: pathlib.Path) -> None:
+        super().__init__(config_file)
+        self._saved_values: Dict[str, Any] = {}
+        self._shards: Dict[str, pathlib.Path] = {}
+        self._unloaded_shards: Set[str] = set()
+        self._shards_lock = threading.RLock()
+
+    def __getitem__(self, item: str) -> Any:
+        try:
+            return super().__getitem__(item)
+        except KeyError:
+            if not self._load_shard_of_key(item):
+                raise
+            return super().__getitem__(item)
+
     def load(self) -> None:
-        """Loads values from the toml file."""
-        toml_dict = toml.load(self.config_file)
-        for name, value in toml_dict.items():
-            self._load_parameter(name, value)
+        """Loads values from the toml file and its shards."""
+        self._saved_values = {}
+        toml_dict = _load_toml_file(self.config_file)
+        includes = toml_dict.pop(self.include_key, {})
+        with self._shards_lock:
+            self._shards = {
+                prefix: self.config_file.parent / shard_path
+                for prefix, shard_path in includes.items()
+            }
+            self._unloaded_shards = set(self._shards)
+        self._load_table(toml_dict, "", self.config_file)
+        if not (self.lazy or self.load_shards_lazily):
+            self._load_shards(list(self._shards))
+
+    def _load_table(
+        self,
+        table: Dict[str, Any],
+        prefix: str,
+        file_path: pathlib.Path,
+        overwrite: bool = True,
+    ) -> None:
+        for key, value in _flatten_table(table, prefix, file_path).items():
+            self._saved_values[key] = value
+            # Values set before a lazy shard is loaded are more recent than the values
+            # in the shard file.
+            if overwrite or key not in self.data:
+                self._load_parameter(key, value)
+
+    def _load_shards(self, prefixes: List[str]) -> None:
+        with self._shards_lock:
+            prefixes = [
+                prefix for prefix in prefixes if prefix in self._unloaded_shards
+            ]
+            if len(prefixes) == 1:
+                shard_dicts = [_load_toml_file(self._shards[prefixes[0]])]
+            else:
+                with concurrent.futures.ThreadPoolExecutor() as executor:
+                    shard_dicts = list(
+                        executor.map(
+                            _load_toml_file,
+                            [self._shards[prefix] for prefix in prefixes],
+                        )
+                    )
+            for prefix, shard_dict in zip(prefixes, shard_dicts):
+                shard_file = self._shards[prefix]
+                self._load_table(shard_dict, prefix + ".", shard_file, overwrite=False)
+                self._unloaded_shards.remove(prefix)
+
+    def _load_shard_of_key(self, key: str) -> bool:
+        prefix = self._get_shard_prefix(key)
+        if prefix is None or prefix not in self._unloaded_shards:
+            return False
+        self._load_shards([prefix])
+        return True
+
+    def _get_shard_prefix(self, key: str) -> Optional[str]:
+        for prefix in self._shards:
+            if key.startswith(prefix + "."):
+                return prefix
+        return None
 
     def save(self) -> None:
         """
-        Saves values to the toml file.
+        Saves values to the toml file and its shards.
 
-        The method keeps the eventual comments in the original file.
+        The method keeps the eventual comments in the original files. Only the files
+        and lines of values modified since the last load or save are rewritten, and
+        new values are added at the end of their table.
         """
-        toml_writer = _TomlWriter(self)
-        toml_writer.save()
+        keys_by_shard: Dict[Optional[str], List[str]] = {None: []}
+        keys_by_shard.update({prefix: [] for prefix in self._shards})
+        for key in list(self.data):
+            keys_by_shard[self._get_shard_prefix(key)].append(key)
+        for prefix, keys in keys_by_shard.items():
+            if not self._has_modified_values(keys):
+                continue
+            if prefix is None:
+                toml_writer = _TomlWriter(self, self.config_file, keys)
+            else:
+                shard_file = self._shards[prefix]
+                toml_writer = _TomlWriter(self, shard_file, keys, prefix + ".")
+            toml_writer.save()
+
+    def _has_modified_values(self, keys: List[str]) -> bool:
+        for key in keys:
+            try:
+                value = self.translate_value(self.data[key])
+            except KeyError:
+                continue
+            if key not in self._saved_values or self._saved_values[key] != value:
+                return True
+        return False
+
+
+def _load_toml_file(file_path: pathlib.Path) -> Dict[str, Any]:
+    toml_dict: Dict[str, Any]
+    if sys.version_info >= (3, 11):
+        with open(file_path, "rb") as toml_file:
+            toml_dict = tomllib.load(toml_file)
+    else:  # pragma: no cover
+        toml_dict = toml.load(file_path)
+    return toml_dict
+
+
+def _loads_toml(content: str) -> Dict[str, Any]:
+    toml_dict: Dict[str, Any]
+    if sys.version_info >= (3, 11):
+        toml_dict = tomllib.loads(content)
+    else:  # pragma: no cover
+        toml_dict = toml.loads(content)
+    return toml_dict
+
+
+def _get_leaves(
+    table: Dict[str, Any], parts: Tuple[str, ...] = ()
+) -> Iterator[Tuple[Tuple[str, ...], Any]]:
+    # The key parts and values of the values of a table which are not tables.
+    for name, value in table.items():
+        if isinstance(value, dict):
+            yield from _get_leaves(value, parts + (name,))
+        else:
+            yield parts + (name,), value
+
+
+def _flatten_table(
+    table: Dict[str, Any], prefix: str, file_path: pathlib.Path
+) -> Dict[str, Any]:
+    flat_table: Dict[str, Any] = {}
+    for parts, value in _get_leaves(table):
+        key = prefix + ".".join(parts)
+        # Keys holding dots, such as "a.b" = 1, cannot be told apart from nested keys.
+        if key in flat_table:
+            raise ValueError(f"Several keys of {file_path} are flattened into {key}")
+        flat_table[key] = value
+    return flat_table
+
+
+def _set_nested_value(table: Dict[str, Any], parts: List[str], value: Any) -> None:
+    *parents, last_part = parts
+    for part in parents:
+        table = table.setdefault(part, {})
+        if not isinstance(table, dict):
+            raise ValueError(f"{part} is both a value and a table")
+    if last_part in table:
+        raise ValueError(f"{last_part} is both a value and a table")
+    table[last_part] = value
+
+
+def _split_key(dotted_key: str) -> List[str]:
+    parts = []
+    for part in _KEY_PART_PATTERN.findall(dotted_key):
+        if part.startswith('"'):
+            part = json.loads(part)
+        elif part.startswith("'"):
+            part = part[1:-1]
+        parts.append(part)
+    return parts
+
+
+def _format_key(parts: List[str]) -> str:
+    return ".".join(
+        part if _BARE_KEY_PATTERN.match(part) else json.dumps(part) for part in parts
+    )
 
 
 class _TomlWriter:
-    def __init__(self, config_toml: ConfigToml) -> None:
+    def __init__(
+        self,
+        config_toml: ConfigToml,
+        file_path: pathlib.Path,
+        keys: List[str],
+        prefix: str = "",
+    ) -> None:
         self.config_toml: ConfigToml = config_toml
-        self.new_content: str = ""
-        self.parameters_saved: List[str] = []
-        self.data = self.config_toml.data
+        self.file_path = file_path
+        self.prefix = prefix
+        self.original_content: str = ""
+        self.new_lines: List[str] = []
+        self.parameters_saved: Set[str] = set()
+        self.section_ends: Dict[str, int] = {}
+        # The array of tables whose remaining lines are skipped, as it was rewritten.
+        self.skipped_array: Optional[str] = None
+        # A copy, as the config might be modified by another thread while saving.
+        self.data = {
+            key: self.config_toml.data[key]
+            for key in keys
+            if key in self.config_toml.data
+        }
+        # The writer updates the values saved in the file, as known by the config.
+        # pylint: disable=protected-access
+        self.saved_values = self.config_toml._saved_values
 
+    @instrumentation.timed()
     def save(self) -> None:
         # public method from private class, not documented
         # pylint: disable=missing-function-docstring
@@ -59,40 +295,227 @@ class _TomlWriter:
         self._add_new_lines()
 
     def _transform_existing_lines(self) -> None:
-        with open(self.config_toml.config_file, "r") as toml_file:
-            for line in toml_file.readlines():
-                new_line = self._transform_line(line)
-                self.new_content += new_line
+        with open(self.file_path, "r") as toml_file:
+            self.original_content = toml_file.read()
+        lines = self.original_content.splitlines(keepends=True)
+        # The prefix of the current table, None inside an array of tables.
+        table: Optional[str] = ""
+        self.section_ends[""] = 0
+        index = 0
+        while index < len(lines):
+            line = lines[index]
+            table, lines_read = self._transform_lines(lines, index, table)
+            index += lines_read
+            if table is not None and not line.lstrip().startswith("#"):
+                if line.strip():
+                    self.section_ends[table] = len(self.new_lines)
 
-    def _transform_line(self, line: str) -> str:
-        key = line.split(" ")[0]
+    def _transform_lines(
+        self, lines: List[str], index: int, table: Optional[str]
+    ) -> Tuple[Optional[str], int]:
+        line = lines[index]
+        array_table_match = _ARRAY_TABLE_LINE_PATTERN.match(line)
+        table_match = _TABLE_LINE_PATTERN.match(line)
+        if self.skipped_array is not None:
+            header_match = array_table_match or table_match
+            if header_match is None:
+                return None, 1
+            header = self.prefix + ".".join(_split_key(header_match.group(1)))
+            if header == self.skipped_array or header.startswith(
+                self.skipped_array + "."
+            ):
+                return None, 1
+            self.skipped_array = None
+        if array_table_match is not None:
+            return self._transform_array_table(array_table_match.group(1), line)
+        if table_match is not None:
+            self.new_lines.append(line)
+            return ".".join(_split_key(table_match.group(1))), 1
+        key_match = _KEY_LINE_PATTERN.match(line)
+        if key_match is None or table is None:
+            self.new_lines.append(line)
+            return table, 1
+        indent, raw_key, value_text = key_match.groups()
+        key = self.prefix + ".".join(([table] if table else []) + _split_key(raw_key))
+        lines_read = self._count_value_lines(lines, index, value_text)
+        original_lines = "".join(lines[index : index + lines_read])
+        if key not in self.data and value_text.lstrip().startswith("{"):
+            new_line = self._transform_inline_table(
+                key, indent, raw_key, original_lines
+            )
+        else:
+            new_line = self._transform_line(key, indent + raw_key, original_lines)
+        self.new_lines.append(new_line)
+        return table, lines_read
+
+    def _transform_array_table(self, raw_name: str, line: str) -> Tuple[None, int]:
+        # A modified array of tables is rewritten as a whole, at the place of its first
+        # table, the lines of all its tables being skipped.
+        key = self.prefix + ".".join(_split_key(raw_name))
+        value: Any = None
+        if key in self.data:
+            value = self.config_toml.translate_value(self.data[key])
+        is_modified = key in self.data and self.saved_values.get(key) != value
+        if is_modified and key in self.parameters_saved:
+            self.skipped_array = key
+            return None, 1
+        self.parameters_saved.add(key)
+        if not is_modified:
+            self.new_lines.append(line)
+            return None, 1
+        if not isinstance(value, list) or not all(
+            isinstance(item, dict) for item in value
+        ):
+            raise ValueError(
+                f"{key} is an array of tables in {self.file_path}, and can only be "
+                f"saved as a list of dictionaries"
+            )
+        header = line if line.endswith("\n") else line + "\n"
+        for table in value:
+            self.new_lines.append(header)
+            self.new_lines += [
+                f"{_format_key([name])} = {self._translate_value_toml(item)}"
+                for name, item in table.items()
+            ]
+            self.new_lines.append("\n")
+        self.skipped_array = key
+        return None, 1
+
+    def _transform_inline_table(
+        self, key: str, indent: str, raw_key: str, original_lines: str
+    ) -> str:
+        # The values of an inline table are flattened into dotted keys when loaded :
+        # they are gathered again, and the table is rewritten if one of them changed.
+        key_prefix = key + "."
+        table_keys = [name for name in self.data if name.startswith(key_prefix)]
+        if not table_keys:
+            return original_lines
+        self.parameters_saved.update(table_keys)
+        is_modified = False
+        for name in table_keys:
+            value = self.config_toml.translate_value(self.data[name])
+            if name not in self.saved_values or self.saved_values[name] != value:
+                is_modified = True
+        if not is_modified:
+            return original_lines
+        # The key parts are taken from the original table, as keys holding dots
+        # cannot be split back from the flattened keys. Only new keys are split.
+        original_table = _loads_toml(original_lines)
+        for part in _split_key(raw_key):
+            original_table = original_table[part]
+        key_parts = {
+            key_prefix + ".".join(parts): list(parts)
+            for parts, _ in _get_leaves(original_table)
+        }
+        table: Dict[str, Any] = {}
+        for name in sorted(table_keys, key=lambda name: name not in key_parts):
+            parts = key_parts.get(name) or name[len(key_prefix) :].split(".")
+            value = self.config_toml.translate_value(self.data[name])
+            try:
+                _set_nested_value(table, parts, value)
+            except ValueError as error:
+                raise ValueError(
+                    f"{name} cannot be saved in the inline table {key} of "
+                    f"{self.file_path} : {error}"
+                ) from None
+        return f"{indent}{raw_key} = {self._translate_value_toml(table)}"
+
+    def _transform_line(self, key: str, written_key: str, original_lines: str) -> str:
         try:
             value = self.data[key]
         except KeyError:
-            new_line = line
-        else:
-            new_line = self._translate_value_toml(key, value)
-            self.parameters_saved.append(key)
-        return new_line
+            return original_lines
+        self.parameters_saved.add(key)
+        value = self.config_toml.translate_value(value)
+        if key in self.saved_values and self.saved_values[key] == value:
+            return original_lines
+        return f"{written_key} = {self._translate_value_toml(value)}"
+
+    @staticmethod
+    def _count_value_lines(lines: List[str], index: int, value_text: str) -> int:
+        # Only arrays, multi-line strings and inline tables holding them can span
+        # several lines.
+        if not value_text.lstrip().startswith(("[", "{", '"""', "'''")):
+            return 1
+        content = "value = " + value_text
+        lines_read = 1
+        while True:
+            try:
+                _loads_toml(content)
+            except ValueError:
+                if index + lines_read >= len(lines):
+                    return 1
+                content += lines[index + lines_read]
+                lines_read += 1
+            else:
+                return lines_read
 
     def _add_new_lines(self) -> None:
-        for key in [
-            key for key in self.data.keys() if key not in self.parameters_saved
-        ]:
-            value = self.data[key]
-            new_line = self._translate_value_toml(key, value)
-            self.new_content += new_line
+        new_lines_by_position: Dict[int, List[str]] = {}
+        for key, value in self.data.items():
+            if key in self.parameters_saved:
+                continue
+            relative_key = key[len(self.prefix) :]
+            table = self._get_table(relative_key)
+            key_parts = (
+                relative_key[len(table) + 1 :] if table else relative_key
+            ).split(".")
+            new_line = (
+                _format_key(key_parts)
+                + " = "
+                + self._translate_value_toml(self.config_toml.translate_value(value))
+            )
+            position = self.section_ends[table]
+            new_lines_by_position.setdefault(position, []).append(new_line)
+        for position in sorted(new_lines_by_position, reverse=True):
+            if position > 0 and not self.new_lines[position - 1].endswith("\n"):
+                self.new_lines[position - 1] += "\n"
+            self.new_lines[position:position] = new_lines_by_position[position]
 
-    def _translate_value_toml(self, key: str, value: ParameterValue) -> str:
-        value = self.config_toml.translate_value(value)
-        toml_single_value_dict = {key: value}
-        new_line = toml.dumps(toml_single_value_dict)
-        return new_line
+    def _get_table(self, key: str) -> str:
+        # The longest existing table containing the key, the root table by default.
+        table = ""
+        for section in self.section_ends:
+            if key.startswith(section + ".") and len(section) > len(table):
+                table = section
+        return table
+
+    @classmethod
+    def _translate_value_toml(cls, value: Any) -> str:
+        return cls._format_value(value) + "\n"
+
+    @classmethod
+    def _format_value(cls, value: Any) -> str:
+        # Dictionaries, and arrays holding them, are written inline, which toml.dumps
+        # does not do.
+        if isinstance(value, dict):
+            items = [
+                f"{_format_key([name])} = {cls._format_value(item)}"
+                for name, item in value.items()
+            ]
+            return "{" + ", ".join(items) + "}"
+        if isinstance(value, list) and any(
+            isinstance(item, (dict, list)) for item in value
+        ):
+            return "[" + ", ".join(cls._format_value(item) for item in value) + "]"
+        # toml only dumps dictionaries : the value is dumped under a one letter key,
+        # which is then removed.
+        formatted_value: str = toml.dumps({"v": value})[len("v = ") :]
+        return formatted_value.rstrip("\n")
 
     def _write(self) -> None:
-        with open(self.config_toml.config_file, "w") as toml_file:
-            toml_file.write(self.new_content)
+        new_content = "".join(self.new_lines)
+        if new_content != self.original_content:
+            # pylint: disable=protected-access
+            open_for_replacement = self.config_toml._open_for_replacement
+            with open_for_replacement(self.file_path, "w") as toml_file:
+                toml_file.write(new_content)
+        for key, value in self.data.items():
+            self.saved_values[key] = self.config_toml.translate_value(value)
 
     def _reset(self) -> None:
-        self.new_content = ""
-        self.parameters_saved = []
+        self.original_content = ""
+        self.new_lines = []
+        self.parameters_saved = set()
+        self.section_ends = {}
+        self.skipped_array = None
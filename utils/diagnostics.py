@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+"""
+Defines :
+ The track function, registering the long-lived objects of the package (widgets,
+ threads, configs) through weak references.
+
+ The Snapshot class, holding the live counts and retained sizes of the tracked
+ objects, and comparing them with a previous snapshot to find what grew.
+
+The diagnostics are disabled by default, in which case tracking an object costs a
+single check of a global flag. Once enabled, it costs adding the object to a weak
+set : only snapshots walk the tracked objects, and they can therefore be taken from
+time to time in production. Allocation tracing with tracemalloc is slower, and is
+optional.
+
+Example
+-------
+    from utils import diagnostics
+
+    diagnostics.enable()
+    before = diagnostics.take_snapshot()
+    ...
+    after = diagnostics.take_snapshot()
+    print(after.format_report(before))
+
+"""
+
+from __future__ import annotations
+
+import gc
+import sys
+import time
+import types
+import weakref
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set
+
+if TYPE_CHECKING:
+    import tracemalloc
+
+MAX_VISITED_OBJECTS = 100_000
+"""The maximum number of objects visited to compute the retained size of a category."""
+
+_SKIPPED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType)
+
+_tracked: Optional[Dict[str, weakref.WeakSet]] = None
+_is_tracing_allocations = False
+
+
+def enable(trace_allocations: bool = False, frames: int = 1) -> None:
+    """
+    Starts tracking the objects created from now on.
+
+    Parameters
+    ----------
+    trace_allocations:
+        Whether to also start tracemalloc, so that snapshots include the allocations
+        of the whole program, grouped by line. This slows down allocations.
+    frames:
+        The number of frames stored by tracemalloc for each allocation.
+
+    """
+    # pylint: disable=global-statement, import-outside-toplevel, redefined-outer-name
+    global _tracked, _is_tracing_allocations
+    import tracemalloc
+
+    if _tracked is None:
+        _tracked = {}
+    if trace_allocations and not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        _is_tracing_allocations = True
+
+
+def disable() -> None:
+    """
+    Stops tracking objects, and tracing allocations if enable started the tracing.
+    """
+    # pylint: disable=global-statement, import-outside-toplevel, redefined-outer-name
+    global _tracked, _is_tracing_allocations
+    import tracemalloc
+
+    _tracked = None
+    if _is_tracing_allocations:
+        tracemalloc.stop()
+        _is_tracing_allocations = False
+
+
+def is_enabled() -> bool:
+    """Whether the diagnostics are enabled."""
+    return _tracked is not None
+
+
+def track(obj: Any, category: Optional[str] = None) -> None:
+    """
+    Tracks an object, without keeping it alive.
+
+    The category defaults to the name of the class of the object, so that leaked
+    message boxes are distinguished from other widgets.
+    """
+    if _tracked is not None:
+        if category is None:
+            category = type(obj).__qualname__
+        _tracked.setdefault(category, weakref.WeakSet()).add(obj)
+
+
+class CategoryGrowth:
+
+    """
+    The change of a category of tracked objects between two snapshots.
+
+    Attributes
+    ----------
+    category
+        The name of the category.
+    count
+        The number of live objects in the last snapshot.
+    count_diff
+        The number of objects more than in the previous snapshot.
+    size
+        The retained size of the objects in the last snapshot, in bytes.
+    size_diff
+        The growth of the retained size since the previous snapshot, in bytes.
+
+    """
+
+    __slots__ = ("category", "count", "count_diff", "size", "size_diff")
+
+    def __init__(
+        self, category: str, count: int, count_diff: int, size: int, size_diff: int
+    ) -> None:
+        self.category = category
+        self.count = count
+        self.count_diff = count_diff
+        self.size = size
+        self.size_diff = size_diff
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.category}: {self.count} objects ({self.count_diff:+d}), "
+            f"{self.size / 1024:.1f} KiB ({self.size_diff / 1024:+.1f} KiB)"
+        )
+
+
+class Snapshot:
+
+    """
+    The live counts and retained sizes of the tracked objects at a given time.
+
+    The retained size of a category is the size of the python objects reachable from
+    its objects without going through other tracked objects, classes, modules and
+    functions. Each category is measured independently : an object reachable from
+    several categories is counted in each of them.
+
+    Warning
+    -------
+    Only the python side of Qt objects is measured : the memory allocated by Qt
+    itself does not appear in the sizes, but leaked widgets still appear in the
+    counts.
+
+    """
+
+    def __init__(
+        self,
+        counts: Dict[str, int],
+        sizes: Dict[str, int],
+        allocations: Optional[tracemalloc.Snapshot] = None,
+    ) -> None:
+        self.taken_at = time.time()
+        self.counts = counts
+        self.sizes = sizes
+        self.allocations = allocations
+
+    def get_growth(self, previous: Snapshot) -> List[CategoryGrowth]:
+        """The categories which grew since previous, the largest growth first."""
+        growth = []
+        for category, count in self.counts.items():
+            size = self.sizes[category]
+            count_diff = count - previous.counts.get(category, 0)
+            size_diff = size - previous.sizes.get(category, 0)
+            if count_diff > 0 or size_diff > 0:
+                growth.append(
+                    CategoryGrowth(category, count, count_diff, size, size_diff)
+                )
+        growth.sort(key=lambda item: (item.size_diff, item.count_diff), reverse=True)
+        return growth
+
+    def get_allocation_growth(
+        self, previous: Snapshot, limit: int = 10
+    ) -> List[tracemalloc.StatisticDiff]:
+        """
+        The lines of code whose allocations grew most since previous.
+
+        Both snapshots must have been taken while allocations were traced.
+        """
+        if self.allocations is None or previous.allocations is None:
+            raise ValueError("Allocations were not traced for both snapshots")
+        statistics = self.allocations.compare_to(previous.allocations, "lineno")
+        growth = [statistic for statistic in statistics if statistic.size_diff > 0]
+        return growth[:limit]
+
+    def format_report(self, previous: Snapshot, limit: int = 10) -> str:
+        """A human readable report of what grew since previous."""
+        elapsed = self.taken_at - previous.taken_at
+        lines = [f"Growth over {elapsed:.0f}s :"]
+        lines += [f"  {growth}" for growth in self.get_growth(previous)[:limit]]
+        if self.allocations is not None and previous.allocations is not None:
+            lines.append("Allocations :")
+            lines += [
+                f"  {statistic}"
+                for statistic in self.get_allocation_growth(previous, limit)
+            ]
+        return "\n".join(lines)
+
+
+def take_snapshot() -> Snapshot:
+    """
+    Counts the live tracked objects and measures their retained sizes.
+
+    The sizes are computed by walking the objects' references, which takes time
+    proportional to the memory retained : snapshots should be taken every few minutes
+    at most, not continuously.
+    """
+    if _tracked is None:
+        raise RuntimeError("The diagnostics are not enabled")
+    # Allocations are traced first, so that they do not include the snapshot itself.
+    allocations = None
+    if "tracemalloc" in sys.modules and sys.modules["tracemalloc"].is_tracing():
+        allocations = _take_allocations_snapshot()
+    categories = {category: list(objects) for category, objects in _tracked.items()}
+    tracked_ids = {id(obj) for objects in categories.values() for obj in objects}
+    counts = {}
+    sizes = {}
+    for category, objects in categories.items():
+        counts[category] = len(objects)
+        sizes[category] = _get_retained_size(objects, tracked_ids)
+    return Snapshot(counts, sizes, allocations)
+
+
+def _get_retained_size(objects: List[Any], tracked_ids: Set[int]) -> int:
+    size = 0
+    remaining = list(objects)
+    visited: Set[int] = set()
+    while remaining and len(visited) < MAX_VISITED_OBJECTS:
+        obj = remaining.pop()
+        if id(obj) in visited or isinstance(obj, _SKIPPED_TYPES):
+            continue
+        visited.add(id(obj))
+        size += sys.getsizeof(obj, 0)
+        remaining.extend(
+            referent
+            for referent in gc.get_referents(obj)
+            if id(referent) not in tracked_ids
+        )
+    return size
+
+
+def _take_allocations_snapshot() -> tracemalloc.Snapshot:
+    # pylint: disable=import-outside-toplevel, redefined-outer-name
+    import tracemalloc
+
+    return tracemalloc.take_snapshot().filter_traces(
+        [
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ]
+    )
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+
+"""
+Defines :
+ The span context manager and the timed decorator, recording the time spent in the
+ hot paths of the package (config I/O, widget creation, background tasks).
+
+ The Registry class, holding counters and histograms for the whole process, which
+ can be dumped as json or as a Chrome trace file (chrome://tracing, Perfetto).
+
+The instrumentation is disabled by default, in which case a span costs a single
+check of a global flag.
+
+Example
+-------
+    from utils import instrumentation
+
+    instrumentation.enable()
+    ...
+    instrumentation.dump_json(pathlib.Path("timings.json"))
+    instrumentation.dump_chrome_trace(pathlib.Path("trace.json"))
+
+"""
+
+from __future__ import annotations
+
+import collections
+import json
+import os
+import pathlib
+import threading
+import time
+from functools import wraps
+from typing import Any, Callable, Deque, Dict, List, Optional, TypeVar
+
+MyCallable = TypeVar("MyCallable", bound=Callable[..., Any])
+
+TraceEvent = Dict[str, Any]
+Statistics = Dict[str, Dict[str, Any]]
+
+
+class Histogram:
+
+    """
+    The distribution of the durations recorded under a span name.
+
+    Durations are counted in buckets whose bounds are powers of 2 microseconds, which
+    keeps the memory used constant whatever the number of recorded spans.
+    """
+
+    __slots__ = ("count", "total", "minimum", "maximum", "buckets")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float("inf")
+        self.maximum = 0.0
+        self.buckets: Dict[int, int] = collections.defaultdict(int)
+
+    def add(self, duration: float) -> None:
+        """Adds a duration, in seconds."""
+        self.count += 1
+        self.total += duration
+        self.minimum = min(self.minimum, duration)
+        self.maximum = max(self.maximum, duration)
+        bucket = int(duration * 1_000_000).bit_length()
+        self.buckets[bucket] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The histogram as a json serializable dictionary, durations in ms."""
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total * 1000 / self.count if self.count else 0.0,
+            "min_ms": self.minimum * 1000 if self.count else 0.0,
+            "max_ms": self.maximum * 1000,
+            "buckets_us": {
+                f"<{2 ** bucket}": count
+                for bucket, count in sorted(self.buckets.items())
+            },
+        }
+
+
+class Registry:
+
+    """
+    Holds the timings recorded in the process.
+
+    Parameters
+    ----------
+    max_events:
+        The number of individual spans kept for the Chrome trace. When the limit is
+        reached, the oldest spans are dropped. Histograms are not affected.
+
+    """
+
+    def __init__(self, max_events: int = 100_000) -> None:
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = collections.defaultdict(int)
+        self.events: Deque[TraceEvent] = collections.deque(maxlen=max_events)
+
+    def record(self, name: str, start: float, duration: float) -> None:
+        """Records a span, start being a time.perf_counter value."""
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": (start - self._origin) * 1_000_000,
+            "dur": duration * 1_000_000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(duration)
+            self.events.append(event)
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """Increments the counter name."""
+        with self._lock:
+            self.counters[name] += value
+
+    def get_statistics(self) -> Statistics:
+        """The histograms and counters, as a json serializable dictionary."""
+        with self._lock:
+            return {
+                "histograms": {
+                    name: histogram.to_dict()
+                    for name, histogram in self.histograms.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+    def get_trace_events(self) -> List[TraceEvent]:
+        """The recorded spans, in the Chrome trace event format."""
+        with self._lock:
+            return list(self.events)
+
+    def dump_json(self, file_path: pathlib.Path) -> None:
+        """Writes the histograms and counters to a json file."""
+        with open(file_path, "w") as json_file:
+            json.dump(self.get_statistics(), json_file, indent=4)
+
+    def dump_chrome_trace(self, file_path: pathlib.Path) -> None:
+        """Writes the recorded spans to a file readable by chrome://tracing."""
+        with open(file_path, "w") as trace_file:
+            json.dump({"traceEvents": self.get_trace_events()}, trace_file)
+
+
+class _Span:
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> _Span:
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        duration = time.perf_counter() - self.start
+        _registry.record(self.name, self.start, duration)
+
+
+class _NullSpan:
+
+    __slots__ = ()
+
+    def __enter__(self) -> _NullSpan:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+_enabled = False
+_registry = Registry()
+
+
+def enable(max_events: Optional[int] = None) -> None:
+    """
+    Starts recording timings.
+
+    If max_events is given, the registry is replaced by a new one keeping at most
+    max_events spans for the Chrome trace.
+    """
+    global _enabled, _registry  # pylint: disable=global-statement
+    if max_events is not None:
+        _registry = Registry(max_events)
+    _enabled = True
+
+
+def disable() -> None:
+    """Stops recording timings. Already recorded timings are kept."""
+    global _enabled  # pylint: disable=global-statement
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    """Whether timings are currently recorded."""
+    return _enabled
+
+
+def reset() -> None:
+    """Discards all recorded timings."""
+    global _registry  # pylint: disable=global-statement
+    _registry = Registry(_registry.events.maxlen or 100_000)
+
+
+def get_registry() -> Registry:
+    """The registry holding the timings of the process."""
+    return _registry
+
+
+def span(name: str) -> Any:
+    """
+    A context manager recording the time spent in its block under name.
+
+    When the instrumentation is disabled, a shared do-nothing context manager is
+    returned.
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def timed(name: Optional[str] = None) -> Callable[[MyCallable], MyCallable]:
+    """
+    Decorator recording the time spent in the function.
+
+    Parameters
+    ----------
+    name:
+        The name under which the timings are recorded. Defaults to the qualified name
+        of the function.
+
+    """
+
+    def decorator(func: MyCallable) -> MyCallable:
+        span_name = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore
+
+    return decorator
+
+
+def increment(name: str, value: int = 1) -> None:
+    """Increments the counter name, if the instrumentation is enabled."""
+    if _enabled:
+        _registry.increment(name, value)
+
+
+def dump_json(file_path: pathlib.Path) -> None:
+    """Writes the histograms and counters of the process to a json file."""
+    _registry.dump_json(file_path)
+
+
+def dump_chrome_trace(file_path: pathlib.Path) -> None:
+    """Writes the spans recorded in the process to a Chrome trace file."""
+    _registry.dump_chrome_trace(file_path)
@@ -5,17 +5,24 @@ Defines :
  The MyCustomWidget class, a convenience base class with generic functions. The derived
  class must also inherit from a QtWidgets.QWidget.
 
+ The DeferredWidget class, a placeholder replaced by its sub-form the first time it is
+ shown.
+
+ The display_info_while_running and run_in_background decorators, executing a method
+ in a separate thread while displaying information in a message box.
+
 """
 
 from __future__ import annotations
 
 import re
-from functools import wraps
+from functools import partial, wraps
 from pathlib import Path
-from typing import Optional, Type, TypeVar, Callable, Any
+from typing import Dict, List, Optional, Type, TypeVar, Callable, Any
 
 from PySide6 import QtCore, QtUiTools, QtWidgets
 
+from utils import diagnostics, instrumentation
 from utils.functions import get_data_folder
 
 MyType = TypeVar("MyType")
@@ -62,15 +69,116 @@ class MyThread(QtCore.QThread):
         self.func = func
         self.args = args
         self.kwargs = kwargs
+        self.result: Any = None
+        self.exception: Optional[BaseException] = None
+        self.is_done = False
+        diagnostics.track(self)
 
     def run(self) -> None:
         """
         Executes the function and signals the end.
+
+        The value returned by the function, or the exception it raised, is stored in
+        the result or exception attribute.
         """
-        self.func(self.parent(), *self.args, **self.kwargs)
+        with instrumentation.span(f"MyThread.run:{self.func.__qualname__}"):
+            try:
+                self.result = self.func(self.parent(), *self.args, **self.kwargs)
+            except Exception as exception:  # pylint: disable=broad-except
+                self.exception = exception
+        self.is_done = True
         self.finished.emit()  # type: ignore
 
 
+class DeferredWidget(QtCore.QObject):
+
+    """
+    A placeholder widget, whose sub-form is only built the first time it is shown.
+
+    The sub-form is added to the layout of the placeholder (a vertical layout without
+    margins is created if the placeholder has none).
+
+    Parameters
+    ----------
+    placeholder:
+        The empty widget, from the .ui file, in which the sub-form is built.
+    build:
+        The function creating the sub-form, called with the placeholder as parent.
+
+    Warning
+    -------
+    This object should not be instantiated directly : deferred widgets are created by
+    MyCustomWidget.create_widget, see MyCustomWidget.deferred_widgets.
+
+    """
+
+    built: QtCore.Signal = QtCore.Signal(QtWidgets.QWidget)
+    """
+    A signal sent with the sub-form, once it has been built.
+    """
+
+    def __init__(
+        self,
+        placeholder: QtWidgets.QWidget,
+        build: Callable[[QtWidgets.QWidget], QtWidgets.QWidget],
+    ) -> None:
+        super().__init__(placeholder)
+        self.placeholder = placeholder
+        self.widget: Optional[QtWidgets.QWidget] = None
+        self._build = build
+        placeholder.installEventFilter(self)
+
+    def eventFilter(  # pylint: disable=invalid-name
+        self, watched: QtCore.QObject, event: QtCore.QEvent
+    ) -> bool:
+        """Builds the sub-form when the placeholder is first shown."""
+        if watched is self.placeholder and event.type() == QtCore.QEvent.Type.Show:
+            self.build()
+        return False
+
+    def build(self) -> QtWidgets.QWidget:
+        """Builds the sub-form if needed, and returns it."""
+        if self.widget is None:
+            self.placeholder.removeEventFilter(self)
+            name = self.placeholder.objectName()
+            with instrumentation.span(f"DeferredWidget.build:{name}"):
+                widget = self._build(self.placeholder)
+            layout = self.placeholder.layout()
+            if layout is None:
+                layout = QtWidgets.QVBoxLayout(self.placeholder)
+                layout.setContentsMargins(0, 0, 0, 0)
+            layout.addWidget(widget)
+            widget.show()
+            self.widget = widget
+            self.built.emit(widget)  # type: ignore
+        return self.widget
+
+
+class _FirstPaintWatcher(QtCore.QObject):
+
+    """
+    Calls a function once the event loop is idle after the first paint of a widget.
+    """
+
+    def __init__(self, widget: QtWidgets.QWidget, func: Callable[[], Any]) -> None:
+        super().__init__(widget)
+        self.widget = widget
+        self.func = func
+        widget.installEventFilter(self)
+
+    def eventFilter(  # pylint: disable=invalid-name
+        self, watched: QtCore.QObject, event: QtCore.QEvent
+    ) -> bool:
+        """Schedules the function after the first paint event of the widget."""
+        if watched is self.widget and event.type() == QtCore.QEvent.Type.Paint:
+            self.widget.removeEventFilter(self)
+            # The paint event is processed after the filter : the function is only
+            # called once the event loop has nothing more urgent to do.
+            QtCore.QTimer.singleShot(0, self.widget, self.func)
+            self.deleteLater()
+        return False
+
+
 class MyCustomWidget:
 
     """
@@ -83,6 +191,9 @@ class MyCustomWidget:
     ----------------
     ui_file_name
     ui_folder_path
+    deferred_widgets
+    deferred_prefix
+    prebuild_deferred_widgets
 
     Class Methods
     -------------
@@ -115,6 +226,31 @@ class MyCustomWidget:
     the class is defined will be used.
     """
 
+    deferred_widgets: Dict[str, Type[MyCustomWidget]] = {}
+    """
+    The placeholders whose sub-form is only built the first time they are shown, such
+    as tabs or stacked pages the user might never open. The keys are the object names
+    of the placeholders (empty widgets in the .ui file), and the values the classes of
+    the sub-forms, which are created with their own create_widget method.
+    """
+
+    deferred_prefix: str = "deferred_"
+    """
+    The prefix of the object names of placeholders not listed in deferred_widgets. A
+    placeholder named "deferred_settings_page" is built from the settings_page.ui file,
+    in the ui folder of the class, with the loader of the class.
+    """
+
+    prebuild_deferred_widgets: bool = False
+    """
+    Whether the deferred sub-forms are built in advance, one at a time, whenever the
+    event loop is idle. Prebuilding only starts once the widget has been painted for
+    the first time, so that the first paint is not delayed, while opening a sub-form
+    later is instantaneous.
+    """
+
+    _deferred: Dict[str, DeferredWidget]
+
     # def __init__(self) -> None:
     #     self.my_thread: Optional[MyThread] = None
     #     self.msg_box: Optional[MyMsgBox] = None
@@ -130,8 +266,65 @@ class MyCustomWidget:
         widget = cls._create_widget_using_loader(parent)
         assert isinstance(widget, cls)
         assert isinstance(widget, QtWidgets.QWidget)
+        widget._install_deferred_widgets()
+        diagnostics.track(widget)
         return widget
 
+    def get_deferred_widget(self, name: str) -> QtWidgets.QWidget:
+        """
+        Gets the sub-form of the placeholder with the given object name.
+
+        The sub-form is built immediately if it has not been shown yet.
+        """
+        return self._deferred[name].build()
+
+    def start_prebuilding(self) -> None:
+        """
+        Builds the deferred sub-forms not built yet, one at a time, whenever the event
+        loop is idle.
+        """
+        assert isinstance(self, QtWidgets.QWidget)
+        QtCore.QTimer.singleShot(0, self, self._prebuild_next_deferred_widget)
+
+    def _install_deferred_widgets(self) -> None:
+        assert isinstance(self, QtWidgets.QWidget)
+        self._deferred = {}
+        for placeholder in self.findChildren(QtWidgets.QWidget):
+            name = placeholder.objectName()
+            build = self._get_deferred_widget_builder(name)
+            if build is not None:
+                self._deferred[name] = DeferredWidget(placeholder, build)
+        if self.prebuild_deferred_widgets and self._deferred:
+            _FirstPaintWatcher(self, self.start_prebuilding)
+
+    def _get_deferred_widget_builder(
+        self, name: str
+    ) -> Optional[Callable[[QtWidgets.QWidget], QtWidgets.QWidget]]:
+        if name in self.deferred_widgets:
+            widget_class = self.deferred_widgets[name]
+            return widget_class.create_widget  # type: ignore
+        if self.deferred_prefix and name.startswith(self.deferred_prefix):
+            ui_file_name = name[len(self.deferred_prefix) :] + ".ui"
+            return partial(self._create_deferred_widget_from_ui_file, ui_file_name)
+        return None
+
+    @classmethod
+    def _create_deferred_widget_from_ui_file(
+        cls, ui_file_name: str, parent: QtWidgets.QWidget
+    ) -> QtWidgets.QWidget:
+        loader = cls._get_loader()
+        ui_file = QtCore.QFile(str(cls._get_ui_folder_path() / ui_file_name))
+        return cls._create_new_widget_from_ui_file(loader, parent, ui_file)
+
+    def _prebuild_next_deferred_widget(self) -> None:
+        pending = [
+            deferred for deferred in self._deferred.values() if deferred.widget is None
+        ]
+        if pending:
+            pending[0].build()
+        if len(pending) > 1:
+            self.start_prebuilding()
+
     def _has_parent(self) -> bool:
         assert isinstance(self, QtWidgets.QWidget)
         parent = self.parent()  # pylint: disable=no-member
@@ -153,7 +346,8 @@ class MyCustomWidget:
         ui_file: QtCore.QFile,
     ) -> QtWidgets.QWidget:
         ui_file.open(QtCore.QFile.ReadOnly)
-        widget = loader.load(ui_file, parent)
+        with instrumentation.span("QUiLoader.load"):
+            widget = loader.load(ui_file, parent)
         ui_file.close()
         return widget
 
@@ -251,13 +445,13 @@ class MyCustomWidget:
 
         Warning
         -------
-        This methods needs the my_thread and my_msg_box attributes of the widget
-        to hve been initialized, and should only be used inside a method wrapped
-        with display_info_while_running.
+        This methods should only be used inside a method wrapped with
+        display_info_while_running or run_in_background.
 
         """
-        if self.my_thread is not None:
-            self.my_thread.update_message.emit(msg)  # type: ignore
+        my_thread = self._get_current_thread()
+        if my_thread is not None:
+            my_thread.update_message.emit(msg)  # type: ignore
 
     def set_msg_box_title(self, title: str) -> None:
         """
@@ -265,13 +459,22 @@ class MyCustomWidget:
 
         Warning
         -------
-        This methods needs the my_thread and my_msg_box attributes of the widget
-        to hve been initialized, and should only be used inside a method wrapped
-        with display_info_while_running.
+        This methods should only be used inside a method wrapped with
+        display_info_while_running or run_in_background.
 
         """
-        if self.my_thread is not None:
-            self.my_thread.update_title.emit(title)  # type: ignore
+        my_thread = self._get_current_thread()
+        if my_thread is not None:
+            my_thread.update_title.emit(title)  # type: ignore
+
+    def _get_current_thread(self) -> Optional[MyThread]:
+        # Several threads might be running for the same widget (run_in_background) :
+        # messages are sent through the thread the method is running in.
+        current_thread = QtCore.QThread.currentThread()
+        if isinstance(current_thread, MyThread):
+            return current_thread
+        my_thread: Optional[MyThread] = getattr(self, "my_thread", None)
+        return my_thread
 
     def handle_thread_finished(self) -> None:
         """
@@ -281,6 +484,8 @@ class MyCustomWidget:
         running thread to simply closing the message box.
         """
         assert self.msg_box is not None
+        if self.my_thread is not None and self.my_thread.exception is not None:
+            self.msg_box.label.setText(f"Error : {self.my_thread.exception}")
         self.msg_box.pushButton.setText("OK")
         self.msg_box.pushButton.clicked.connect(self.msg_box.close)
 
@@ -306,6 +511,16 @@ class MyMsgBox(QtWidgets.QDialog, MyCustomWidget):
 
     """
 
+    label: QtWidgets.QLabel
+    """
+    The label displaying the message, from the .ui file.
+    """
+
+    pushButton: QtWidgets.QPushButton  # pylint: disable=invalid-name
+    """
+    The button closing the message box, from the .ui file.
+    """
+
     @classmethod
     def create_msg_box(cls) -> MyCustomWidget:
         """Factory method to create a MyMsgBox. """
@@ -340,3 +555,223 @@ def display_info_while_running(func: Callable) -> Callable:
         self.msg_box.exec_()
 
     return wrapper
+
+
+class TaskHandle(QtCore.QObject):
+
+    """
+    A future-like handle on a method running in the background.
+
+    Returned by the methods wrapped with run_in_background.
+
+    Warning
+    -------
+    Callbacks are called in the GUI thread, once the method has finished running.
+
+    """
+
+    def __init__(self, my_thread: MyThread, tasks: BackgroundTasks) -> None:
+        # The handle has no parent : it is owned by the caller, and kept alive by
+        # tasks while running only, so that finished handles are not accumulated.
+        super().__init__()
+        self._thread: Optional[MyThread] = my_thread
+        self._tasks = tasks
+        self._callbacks: List[Callable[[TaskHandle], Any]] = []
+        self._result: Any = None
+        self._exception: Optional[BaseException] = None
+        self._is_cancelled = False
+        self.title: str = my_thread.func.__name__
+        self.message: str = ""
+        my_thread.update_message.connect(self._handle_message)  # type: ignore
+        my_thread.update_title.connect(self._handle_title)  # type: ignore
+        my_thread.finished.connect(self._handle_finished)  # type: ignore
+
+    def done(self) -> bool:
+        """Whether the method has finished running."""
+        return self._thread is None or self._thread.is_done
+
+    def result(self) -> Any:
+        """
+        The value returned by the method, raising the exception it raised if any.
+
+        If the method is still running, blocks until it has finished. This should
+        therefore not be called from the GUI thread before the task is done.
+        """
+        exception = self.exception()
+        if exception is not None:
+            raise exception
+        return self._thread.result if self._thread is not None else self._result
+
+    def exception(self) -> Optional[BaseException]:
+        """The exception raised by the method, blocking until it has finished."""
+        if self._thread is not None:
+            self._thread.wait()
+            return self._thread.exception
+        return self._exception
+
+    def add_done_callback(self, func: Callable[[TaskHandle], Any]) -> None:
+        """Calls func with the handle as its only argument once the task is done."""
+        if self._thread is None:
+            func(self)
+        else:
+            self._callbacks.append(func)
+
+    def cancel(self) -> None:
+        """
+        Terminates the thread running the method.
+
+        Unless the method had already finished running, the task is then done, and
+        its exception is a concurrent.futures.CancelledError.
+        """
+        # concurrent.futures imports logging, and is only needed to cancel a task.
+        import concurrent.futures  # pylint: disable=import-outside-toplevel
+
+        my_thread = self._thread
+        if my_thread is not None and not my_thread.is_done:
+            my_thread.terminate()
+            my_thread.wait()
+            if not my_thread.is_done:
+                my_thread.exception = concurrent.futures.CancelledError()
+                my_thread.is_done = True
+                self._is_cancelled = True
+                self._handle_finished()
+
+    def cancelled(self) -> bool:
+        """Whether the task was terminated by cancel before it finished running."""
+        return self._is_cancelled
+
+    @QtCore.Slot(str)
+    def _handle_message(self, message: str) -> None:
+        self.message = message
+        self._tasks.refresh()
+
+    @QtCore.Slot(str)
+    def _handle_title(self, title: str) -> None:
+        self.title = title
+        self._tasks.refresh()
+
+    @QtCore.Slot()
+    def _handle_finished(self) -> None:
+        # QThread also emits its own finished signal, once run has returned.
+        if self._thread is None:
+            return
+        # The signal is emitted at the very end of run : waiting is almost immediate,
+        # and needed before the thread can be deleted.
+        self._thread.wait()
+        self._result = self._thread.result
+        self._exception = self._thread.exception
+        self._thread.deleteLater()
+        self._thread = None
+        self._tasks.handle_task_finished(self)
+        for callback in self._callbacks:
+            callback(self)
+        self._callbacks = []
+
+
+class BackgroundTasks(QtCore.QObject):
+
+    """
+    Runs methods of a widget in the background, several at the same time, displaying
+    their progress in a single non-modal message box.
+
+    Warning
+    -------
+    This object should not be instantiated directly, but is rather created by the
+    first method wrapped with run_in_background called on a widget.
+
+    """
+
+    def __init__(self, widget: QtWidgets.QWidget) -> None:
+        super().__init__(widget)
+        self.widget = widget
+        self.msg_box: Optional[MyMsgBox] = None
+        self.running_tasks: Dict[TaskHandle, None] = {}
+        self.finished_tasks = 0
+        self.failed_tasks = 0
+        self.cancelled_tasks = 0
+
+    def start(self, func: Callable, *args: Any, **kwargs: Any) -> TaskHandle:
+        """Starts running func(widget, *args, **kwargs) in a new thread."""
+        my_thread = MyThread(self.widget, func, *args, **kwargs)
+        task = TaskHandle(my_thread, self)
+        self.running_tasks[task] = None
+        self._show_msg_box()
+        my_thread.start()
+        return task
+
+    def handle_task_finished(self, task: TaskHandle) -> None:
+        """Updates the message box once a task is done."""
+        del self.running_tasks[task]
+        self.finished_tasks += 1
+        if task.cancelled():
+            self.cancelled_tasks += 1
+        elif task.exception() is not None:
+            self.failed_tasks += 1
+        self.refresh()
+
+    def cancel(self) -> None:
+        """Terminates all running tasks."""
+        for task in list(self.running_tasks):
+            task.cancel()
+
+    def refresh(self) -> None:
+        """Updates the text of the message box."""
+        if self.msg_box is None:
+            return
+        lines = [f"{task.title} : {task.message}" for task in self.running_tasks]
+        summary = f"{len(self.running_tasks)} running, {self.finished_tasks} done"
+        if self.failed_tasks:
+            summary += f", {self.failed_tasks} failed"
+        if self.cancelled_tasks:
+            summary += f", {self.cancelled_tasks} cancelled"
+        self.msg_box.label.setText("\n".join(lines + [summary]))
+        self.msg_box.pushButton.setText("Cancel" if self.running_tasks else "OK")
+
+    def _show_msg_box(self) -> None:
+        if self.msg_box is None:
+            msg_box = MyMsgBox.create_msg_box()
+            assert isinstance(msg_box, MyMsgBox)
+            msg_box.setWindowTitle("Background tasks")
+            msg_box.pushButton.clicked.connect(self._handle_button_clicked)
+            msg_box.finished.connect(self._handle_msg_box_closed)
+            self.msg_box = msg_box
+        self.refresh()
+        self.msg_box.show()
+
+    @QtCore.Slot()
+    def _handle_button_clicked(self) -> None:
+        if self.running_tasks:
+            self.cancel()
+        elif self.msg_box is not None:
+            self.msg_box.close()
+
+    @QtCore.Slot()
+    def _handle_msg_box_closed(self) -> None:
+        if not self.running_tasks:
+            self.finished_tasks = 0
+            self.failed_tasks = 0
+            self.cancelled_tasks = 0
+
+
+def run_in_background(func: Callable) -> Callable:
+    """
+    Decorator executing a method in a separate thread, without blocking.
+
+    Unlike display_info_while_running, the wrapped method returns immediately a
+    TaskHandle, giving access to the value returned by the method or the exception it
+    raised. Several methods can run at the same time for the same widget, their
+    progress being displayed in a single non-modal message box.
+    """
+
+    @wraps(func)
+    def wrapper(self: Any, *args: Any, **kwargs: Any) -> TaskHandle:
+        """
+        Wrapper for the function.
+        """
+        background_tasks = getattr(self, "background_tasks", None)
+        if background_tasks is None:
+            background_tasks = self.background_tasks = BackgroundTasks(self)
+        task: TaskHandle = background_tasks.start(func, *args, **kwargs)
+        return task
+
+    return wrapper
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+
+"""
+Defines :
+ The sort_rows function, an external merge sort of DataRow tables larger than memory.
+
+ The group_rows function, a hash-partitioned group-by of DataRow tables larger than
+ memory.
+
+Rows are spilled to temporary files (pickled batches) once the memory budget is
+reached, and results are streamed back in batches.
+
+"""
+
+import collections
+import concurrent.futures
+import functools
+import heapq
+import itertools
+import os
+import pathlib
+import pickle
+import sys
+import tempfile
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from utils.my_types import CellValue, DataRow, Header
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+"""The default maximum size of the rows held in memory, in bytes."""
+
+DEFAULT_BATCH_SIZE = 1000
+"""The default number of rows in each batch returned."""
+
+MAX_PARTITIONING_DEPTH = 4
+"""The number of times a partition larger than the memory budget is split again."""
+
+SortKey = Tuple[Any, ...]
+
+_MASK_64 = (1 << 64) - 1
+
+
+def sort_rows(
+    rows: Iterable[DataRow],
+    header: Header,
+    reverse: bool = False,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_workers: Optional[int] = None,
+    temporary_folder: Optional[pathlib.Path] = None,
+) -> Iterator[List[DataRow]]:
+    """
+    Sorts rows by the value of header, yielding the sorted rows in batches.
+
+    The rows are split into runs fitting in the memory budget. Runs are sorted in
+    parallel in a process pool and written to temporary files, which are then merged.
+    If all rows fit in the memory budget, they are simply sorted in memory.
+
+    None values are considered inferior to any other value, and int values inferior
+    to str values.
+
+    Parameters
+    ----------
+    rows:
+        The rows to sort, which can be a generator reading them from a file.
+    header:
+        The header of the column to sort by.
+    reverse:
+        Whether to sort in descending order.
+    memory_budget:
+        The approximate maximum size, in bytes, of the rows held in memory at the
+        same time. It is shared between the runs being sorted by the worker processes
+        and the run being read. The main process also keeps each run sent to a worker
+        until it is sorted, and pickles it to send it : the actual peak can therefore
+        reach about twice the budget.
+    batch_size:
+        The number of rows in each batch yielded.
+    max_workers:
+        The number of processes sorting runs. Defaults to the number of processors.
+    temporary_folder:
+        The folder in which temporary files are created. Defaults to the system's
+        temporary folder.
+
+    Warning
+    -------
+    On Windows, the process pool requires the calling script to be protected by an
+    if __name__ == "__main__" clause.
+
+    """
+    workers = max_workers or os.cpu_count() or 1
+    # Each worker holds a run, while the next one is being read.
+    run_budget = memory_budget // (workers + 1)
+    chunks = _split_in_chunks(rows, run_budget)
+    first_chunk = next(chunks, [])
+    second_chunk = next(chunks, None)
+    if second_chunk is None:
+        first_chunk.sort(key=_get_sort_key_function(header), reverse=reverse)
+        yield from _split_in_batches(first_chunk, batch_size)
+        return
+    chunks = itertools.chain([first_chunk, second_chunk], chunks)
+    with tempfile.TemporaryDirectory(dir=temporary_folder) as folder:
+        run_paths = _create_sorted_runs(
+            chunks, header, reverse, workers, pathlib.Path(folder)
+        )
+        runs = [_read_spilled_rows(run_path) for run_path in run_paths]
+        merged_rows = heapq.merge(
+            *runs, key=_get_sort_key_function(header), reverse=reverse
+        )
+        yield from _split_in_batches(merged_rows, batch_size)
+
+
+def group_rows(
+    rows: Iterable[DataRow],
+    header: Header,
+    partitions: int = 64,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET,
+    temporary_folder: Optional[pathlib.Path] = None,
+) -> Iterator[Tuple[CellValue, List[DataRow]]]:
+    """
+    Groups rows by the value of header, yielding each value with its rows.
+
+    The rows are first dispatched into partitions according to the hash of their
+    value, each partition being written to a temporary file. The partitions are then
+    read back one at a time and grouped in memory. Groups are yielded partition by
+    partition, and therefore in no particular order.
+
+    A partition larger than the memory budget, because of a skewed value (such as
+    many empty cells), is split again with a different hash, up to
+    MAX_PARTITIONING_DEPTH times. If it still does not fit, which means that the rows
+    of a single value are larger than the memory budget, a ValueError is raised.
+
+    Parameters
+    ----------
+    rows:
+        The rows to group, which can be a generator reading them from a file.
+    header:
+        The header of the column to group by.
+    partitions:
+        The number of partitions. Each partition should fit in the memory budget :
+        the larger the table, the more partitions are needed.
+    memory_budget:
+        The maximum size, in bytes, of the rows held in memory at the same time :
+        the rows buffered before being written to the partition files, or the rows
+        of the partition being grouped.
+    temporary_folder:
+        The folder in which temporary files are created. Defaults to the system's
+        temporary folder.
+
+    """
+    with tempfile.TemporaryDirectory(dir=temporary_folder) as folder:
+        yield from _group_partitions(
+            rows, header, partitions, memory_budget, pathlib.Path(folder), "", 0
+        )
+
+
+def _sort_key(header: Header, row: DataRow) -> SortKey:
+    value = row.get(header)
+    if value is None:
+        return (0,)
+    if isinstance(value, str):
+        return (2, value)
+    return (1, value)
+
+
+def _get_sort_key_function(header: Header) -> "functools.partial[SortKey]":
+    # A partial object, rather than a lambda, can be sent to the worker processes.
+    return functools.partial(_sort_key, header)
+
+
+def _get_row_size(row: DataRow) -> int:
+    # An estimation : keys are usually shared between rows, and are not counted.
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row.values())
+
+
+def _split_in_chunks(rows: Iterable[DataRow], budget: int) -> Iterator[List[DataRow]]:
+    chunk: List[DataRow] = []
+    chunk_size = 0
+    for row in rows:
+        chunk.append(row)
+        chunk_size += _get_row_size(row)
+        if chunk_size >= budget:
+            yield chunk
+            chunk = []
+            chunk_size = 0
+    if chunk:
+        yield chunk
+
+
+def _split_in_batches(
+    rows: Iterable[DataRow], batch_size: int
+) -> Iterator[List[DataRow]]:
+    iterator = iter(rows)
+    batch = list(itertools.islice(iterator, batch_size))
+    while batch:
+        yield batch
+        batch = list(itertools.islice(iterator, batch_size))
+
+
+def _create_sorted_runs(
+    chunks: Iterable[List[DataRow]],
+    header: Header,
+    reverse: bool,
+    workers: int,
+    folder: pathlib.Path,
+) -> List[pathlib.Path]:
+    run_paths = []
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures: Deque[concurrent.futures.Future] = collections.deque()
+        for index, chunk in enumerate(chunks):
+            # Waiting for the oldest run keeps the number of runs in memory bounded.
+            if len(futures) >= workers:
+                futures.popleft().result()
+            run_path = folder / f"run_{index}.pickle"
+            futures.append(
+                executor.submit(_sort_run, chunk, header, reverse, run_path)
+            )
+            run_paths.append(run_path)
+        for future in futures:
+            future.result()
+    return run_paths
+
+
+def _sort_run(
+    rows: List[DataRow], header: Header, reverse: bool, run_path: pathlib.Path
+) -> None:
+    # Runs in a worker process, and must therefore be a module-level function.
+    rows.sort(key=_get_sort_key_function(header), reverse=reverse)
+    with open(run_path, "wb") as run_file:
+        for batch in _split_in_batches(rows, DEFAULT_BATCH_SIZE):
+            pickle.dump(batch, run_file, pickle.HIGHEST_PROTOCOL)
+
+
+def _group_partitions(
+    rows: Iterable[DataRow],
+    header: Header,
+    partitions: int,
+    memory_budget: int,
+    folder: pathlib.Path,
+    prefix: str,
+    depth: int,
+) -> Iterator[Tuple[CellValue, List[DataRow]]]:
+    partition_paths, partition_sizes = _write_partitions(
+        rows, header, partitions, memory_budget, folder, prefix, depth
+    )
+    for index, partition_path in enumerate(partition_paths):
+        if partition_sizes[index] <= memory_budget:
+            groups: Dict[CellValue, List[DataRow]] = {}
+            for row in _read_spilled_rows(partition_path):
+                groups.setdefault(row.get(header), []).append(row)
+            os.remove(partition_path)
+            yield from groups.items()
+        elif depth < MAX_PARTITIONING_DEPTH:
+            yield from _group_partitions(
+                _read_spilled_rows(partition_path),
+                header,
+                partitions,
+                memory_budget,
+                folder,
+                f"{prefix}{index}_",
+                depth + 1,
+            )
+            os.remove(partition_path)
+        else:
+            raise ValueError(
+                f"The rows could not be split into partitions fitting in the memory "
+                f"budget of {memory_budget} bytes : a single value of {header} "
+                f"probably holds too many rows"
+            )
+
+
+def _write_partitions(
+    rows: Iterable[DataRow],
+    header: Header,
+    partitions: int,
+    memory_budget: int,
+    folder: pathlib.Path,
+    prefix: str,
+    depth: int,
+) -> Tuple[List[pathlib.Path], List[int]]:
+    partition_paths = [
+        folder / f"partition_{prefix}{index}.pickle" for index in range(partitions)
+    ]
+    partition_sizes = [0] * partitions
+    partition_files = [open(path, "wb") for path in partition_paths]
+    buffers: List[List[DataRow]] = [[] for _ in range(partitions)]
+    buffered_size = 0
+    try:
+        for row in rows:
+            index = _get_partition(row.get(header), depth, partitions)
+            row_size = _get_row_size(row)
+            buffers[index].append(row)
+            partition_sizes[index] += row_size
+            buffered_size += row_size
+            if buffered_size >= memory_budget:
+                _flush_buffers(buffers, partition_files)
+                buffered_size = 0
+        _flush_buffers(buffers, partition_files)
+    finally:
+        for partition_file in partition_files:
+            partition_file.close()
+    return partition_paths, partition_sizes
+
+
+def _get_partition(value: CellValue, depth: int, partitions: int) -> int:
+    # The hash is seeded with the depth and mixed (splitmix64 finalizer), so that the
+    # rows of a partition split again are dispatched independently of the previous
+    # split. Python's own hash of (depth, value) is too correlated for that.
+    mixed = (hash(value) + (depth + 1) * 0x9E3779B97F4A7C15) & _MASK_64
+    mixed = ((mixed ^ (mixed >> 30)) * 0xBF58476D1CE4E5B9) & _MASK_64
+    mixed = ((mixed ^ (mixed >> 27)) * 0x94D049BB133111EB) & _MASK_64
+    return (mixed ^ (mixed >> 31)) % partitions
+
+
+def _flush_buffers(buffers: List[List[DataRow]], partition_files: List[Any]) -> None:
+    for buffer, partition_file in zip(buffers, partition_files):
+        if buffer:
+            pickle.dump(buffer, partition_file, pickle.HIGHEST_PROTOCOL)
+            buffer.clear()
+
+
+def _read_spilled_rows(file_path: pathlib.Path) -> Iterator[DataRow]:
+    with open(file_path, "rb") as spilled_file:
+        while True:
+            try:
+                batch = pickle.load(spilled_file)
+            except EOFError:
+                return
+            yield from batch
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+"""
+Defines :
+ The StallDetector class, a watchdog detecting when the GUI event loop is blocked and
+ recording what the GUI thread was doing at that time.
+
+"""
+
+from __future__ import annotations
+
+import collections
+import heapq
+import sys
+import threading
+import time
+import traceback
+from typing import Counter, List, Optional, Tuple
+
+from PySide6 import QtCore, QtWidgets
+
+
+class Stall:
+
+    """
+    A period during which the GUI event loop did not process any event.
+
+    Attributes
+    ----------
+    started_at
+        The time at which the stall started, as returned by time.time.
+    duration
+        The duration of the stall, in seconds.
+    stack
+        The stack of the GUI thread most often sampled during the stall, which is
+        most likely the one of the blocking code.
+    samples
+        The number of times the stack of the GUI thread was sampled.
+
+    """
+
+    __slots__ = ("started_at", "duration", "stack", "samples")
+
+    def __init__(
+        self, started_at: float, duration: float, stack: str, samples: int
+    ) -> None:
+        self.started_at = started_at
+        self.duration = duration
+        self.stack = stack
+        self.samples = samples
+
+    def __repr__(self) -> str:
+        return f"Stall(duration={self.duration:.3f}s, samples={self.samples})"
+
+
+class StallDetector(QtCore.QObject):
+
+    """
+    Measures the latency of the event loop, and records the stalls.
+
+    A timer in the GUI thread updates a heartbeat at regular intervals. A helper
+    thread checks the heartbeat : when it has not been updated for more than
+    threshold seconds, the stack of the GUI thread is sampled until the event loop
+    runs again.
+
+    Parameters
+    ----------
+    application:
+        The application whose event loop is monitored. The detector should be created
+        from the GUI thread.
+    threshold:
+        The duration, in seconds, above which the event loop is considered stalled.
+    heartbeat_interval:
+        The interval, in seconds, between two heartbeats.
+    max_stalls:
+        The number of stalls kept, only the longest ones being kept.
+
+    Example
+    -------
+    ::
+
+        stall_detector = StallDetector(app)
+        stall_detector.start()
+        ...
+        for stall in stall_detector.get_worst_stalls(5):
+            print(stall.duration, stall.stack)
+
+    """
+
+    def __init__(
+        self,
+        application: QtWidgets.QApplication,
+        threshold: float = 0.2,
+        heartbeat_interval: float = 0.05,
+        max_stalls: int = 20,
+    ) -> None:
+        super().__init__(application)
+        self.threshold = threshold
+        self.heartbeat_interval = heartbeat_interval
+        self.max_stalls = max_stalls
+        self.max_latency = 0.0
+        self._gui_thread_id = threading.get_ident()
+        self._last_heartbeat = time.monotonic()
+        self._worst_stalls: List[Tuple[float, int, Stall]] = []
+        self._stalls_count = 0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+        self._timer = QtCore.QTimer(self)
+        self._timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self._timer.setInterval(int(heartbeat_interval * 1000))
+        self._timer.timeout.connect(self._beat)
+
+    def start(self) -> None:
+        """Starts monitoring the event loop."""
+        if self._watchdog is not None:
+            return
+        self._last_heartbeat = time.monotonic()
+        self._stop_event.clear()
+        self._timer.start()
+        self._watchdog = threading.Thread(
+            target=self._watch, name="stall-detector", daemon=True
+        )
+        self._watchdog.start()
+
+    def stop(self) -> None:
+        """Stops monitoring the event loop. Recorded stalls are kept."""
+        self._timer.stop()
+        self._stop_event.set()
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+
+    def get_worst_stalls(self, number: Optional[int] = None) -> List[Stall]:
+        """The longest stalls recorded, longest first."""
+        with self._lock:
+            stalls = [stall for _, _, stall in sorted(self._worst_stalls, reverse=True)]
+        return stalls[:number]
+
+    def get_stalls_count(self) -> int:
+        """The number of stalls detected, including those not kept."""
+        return self._stalls_count
+
+    def reset(self) -> None:
+        """Discards the recorded stalls and latency."""
+        with self._lock:
+            self._worst_stalls = []
+            self._stalls_count = 0
+            self.max_latency = 0.0
+
+    @QtCore.Slot()
+    def _beat(self) -> None:
+        now = time.monotonic()
+        latency = now - self._last_heartbeat - self.heartbeat_interval
+        self.max_latency = max(self.max_latency, latency)
+        self._last_heartbeat = now
+
+    def _watch(self) -> None:
+        stalled_heartbeat: Optional[float] = None
+        started_at = 0.0
+        stacks: Counter[str] = collections.Counter()
+        while not self._stop_event.wait(self.heartbeat_interval):
+            last_heartbeat = self._last_heartbeat
+            if stalled_heartbeat is not None and stalled_heartbeat != last_heartbeat:
+                # The event loop ran since the stall started : the stall is over, and
+                # is recorded before a new one is possibly started below.
+                duration = last_heartbeat - stalled_heartbeat - self.heartbeat_interval
+                stack = stacks.most_common(1)[0][0]
+                self._record(Stall(started_at, duration, stack, sum(stacks.values())))
+                stalled_heartbeat = None
+            stalled_for = time.monotonic() - last_heartbeat - self.heartbeat_interval
+            if stalled_for > self.threshold:
+                if stalled_heartbeat is None:
+                    stalled_heartbeat = last_heartbeat
+                    started_at = time.time() - stalled_for
+                    stacks = collections.Counter()
+                stacks[self._sample_gui_thread_stack()] += 1
+
+    def _sample_gui_thread_stack(self) -> str:
+        # pylint: disable=protected-access
+        frame = sys._current_frames().get(self._gui_thread_id)
+        if frame is None:
+            return ""
+        return "".join(traceback.format_stack(frame))
+
+    def _record(self, stall: Stall) -> None:
+        with self._lock:
+            self._stalls_count += 1
+            entry = (stall.duration, self._stalls_count, stall)
+            if len(self._worst_stalls) < self.max_stalls:
+                heapq.heappush(self._worst_stalls, entry)
+            else:
+                heapq.heappushpop(self._worst_stalls, entry)
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+"""
+Defines :
+ The ThumbnailCache class, generating thumbnails in a process pool and keeping them in
+ a persistent disk cache.
+
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import hashlib
+import os
+import pathlib
+import tempfile
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from PIL import Image
+
+from utils.my_types import Pixel
+
+ThumbnailSize = Tuple[Pixel, Pixel]
+ProgressCallback = Callable[[str], None]
+
+
+class ThumbnailCache:
+
+    """
+    Generates thumbnails and keeps them in a disk cache.
+
+    Each thumbnail is stored in a file whose name is a hash of the source path, its
+    modification time and the target size. An unchanged image is therefore never
+    decoded again, while a modified image automatically gets a new thumbnail.
+
+    Parameters
+    ----------
+    cache_folder:
+        The folder in which thumbnails are stored, usually a sub-folder of the data
+        folder of the application (get_data_folder(self) / "thumbnails").
+    size:
+        The maximum width and height of the thumbnails. The aspect ratio of the source
+        image is kept.
+    max_workers:
+        The number of processes used to resize images. If not provided, defaults to
+        the number of processors on the machine.
+
+    Example
+    -------
+    The progress of a batch can be displayed in the message box of a method wrapped
+    with display_info_while_running::
+
+        @display_info_while_running
+        def create_thumbnails(self) -> None:
+            self.thumbnail_cache.generate(self.images, self.set_msg_box_message)
+
+    """
+
+    def __init__(
+        self,
+        cache_folder: pathlib.Path,
+        size: ThumbnailSize = (256, 256),
+        max_workers: Optional[int] = None,
+    ) -> None:
+        self.cache_folder = cache_folder
+        self.size = size
+        self.max_workers = max_workers
+
+    def thumbnail_path(self, source: pathlib.Path) -> pathlib.Path:
+        """
+        The path to the thumbnail of source, generating it if needed.
+
+        Meant to be used as the thumbnail_path function of the objects displayed in a
+        galery.
+
+        """
+        destination = self.get_cached_path(source)
+        if not destination.exists():
+            _create_thumbnail(str(source), str(destination), self.size)
+        return destination
+
+    def get_cached_path(self, source: pathlib.Path) -> pathlib.Path:
+        """The path where the thumbnail of source is (or would be) stored."""
+        key = self._get_key(source)
+        return self.cache_folder / key[:2] / f"{key}.png"
+
+    def generate(
+        self,
+        sources: Iterable[pathlib.Path],
+        progress: Optional[ProgressCallback] = None,
+    ) -> Dict[pathlib.Path, pathlib.Path]:
+        """
+        Creates the thumbnails of all sources, resizing them in a process pool.
+
+        Sources already in the cache are not decoded again.
+
+        Parameters
+        ----------
+        sources:
+            The paths to the images.
+        progress:
+            A function called with a message each time a thumbnail is ready.
+
+        Returns
+        -------
+        Dict[pathlib.Path, pathlib.Path]
+            The path to the thumbnail of each source.
+
+        """
+        thumbnails: Dict[pathlib.Path, pathlib.Path] = {}
+        missing: Dict[pathlib.Path, pathlib.Path] = {}
+        for source in sources:
+            destination = self.get_cached_path(source)
+            thumbnails[source] = destination
+            if not destination.exists():
+                missing[source] = destination
+        if missing:
+            self._generate_missing(missing, progress)
+        return thumbnails
+
+    def _generate_missing(
+        self,
+        missing: Dict[pathlib.Path, pathlib.Path],
+        progress: Optional[ProgressCallback],
+    ) -> None:
+        total = len(missing)
+        with concurrent.futures.ProcessPoolExecutor(self.max_workers) as executor:
+            futures = [
+                executor.submit(
+                    _create_thumbnail, str(source), str(destination), self.size
+                )
+                for source, destination in missing.items()
+            ]
+            for done, future in enumerate(
+                concurrent.futures.as_completed(futures), start=1
+            ):
+                future.result()
+                if progress is not None:
+                    progress(f"Creating thumbnails : {done}/{total}")
+
+    def _get_key(self, source: pathlib.Path) -> str:
+        source = source.resolve()
+        mtime = source.stat().st_mtime_ns
+        width, height = self.size
+        key = f"{source}|{mtime}|{width}x{height}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def _create_thumbnail(source: str, destination: str, size: ThumbnailSize) -> str:
+    # Runs in a worker process, and must therefore be a picklable module-level
+    # function.
+    destination_path = pathlib.Path(destination)
+    destination_path.parent.mkdir(parents=True, exist_ok=True)
+    with Image.open(source) as image:
+        image.thumbnail(size)
+        thumbnail: Image.Image = image
+        if image.mode not in ("RGB", "RGBA", "L", "LA"):
+            thumbnail = image.convert("RGBA")
+        # Writing to a temporary file first ensures that a partially written
+        # thumbnail is never taken for a valid cache entry. Its name is unique, as
+        # several threads or processes might create the same thumbnail.
+        file_descriptor, temporary_name = tempfile.mkstemp(
+            dir=destination_path.parent, suffix=".tmp"
+        )
+        try:
+            with os.fdopen(file_descriptor, "wb") as temporary_file:
+                thumbnail.save(temporary_file, format="PNG")
+            os.replace(temporary_name, destination_path)
+        except BaseException:
+            os.remove(temporary_name)
+            raise
+    return destination